@@ -1,4 +1,5 @@
 from csp import Constraint, Variable, CSP
+from collections import deque
 import random
 import util
 
@@ -15,12 +16,13 @@ class UnassignedVars:
        'mrv'    == select the variable with minimum values in its current domain
                    break ties by the ordering in the CSP variables.
     '''
-    def __init__(self, select_criteria, csp):
+    def __init__(self, select_criteria, csp, rng=None):
         if select_criteria not in ['random', 'fixed', 'mrv']:
             print("Error UnassignedVars given an illegal selection criteria {}. Must be one of 'random', 'stack', 'queue', or 'mrv'".format(select_criteria))
         self.unassigned = list(csp.variables())
         self.csp = csp
         self._select = select_criteria
+        self._rng = rng                 #source of random numbers for 'random' (None: random module)
         if select_criteria == 'fixed':
             #reverse unassigned list so that we can add and extract from the back
             self.unassigned.reverse()
@@ -30,7 +32,8 @@ class UnassignedVars:
             print("Warning, extracting from empty unassigned list")
             return None
         if self._select == 'random':
-            i = random.randint(0,len(self.unassigned)-1)
+            rng = random if self._rng is None else self._rng
+            i = rng.randint(0,len(self.unassigned)-1)
             nxtvar = self.unassigned[i]
             self.unassigned[i] = self.unassigned[-1]
             self.unassigned.pop()
@@ -46,11 +49,463 @@ class UnassignedVars:
         return len(self.unassigned) == 0
 
     def insert(self, var):
-        if not var in self.csp.variables():
+        if self.csp.varIndex(var) is None:
             print("Error, trying to insert variable {} in unassigned that is not in the CSP problem".format(var.name()))
         else:
             self.unassigned.append(var)
 
+class Trail:
+    '''class for recording the values pruned during a search so that they
+       can be restored on backtracking. The trail is a flat stack of
+       (var, code) entries, where code is the integer code of the pruned
+       value (see csp.Variable). Each search level starts with a call to
+       newLevel(), which marks the current top of the stack, and ends
+       with a call to undoLevel(), which restores (in reverse order)
+       every value pruned since the matching newLevel().
+
+       Entries are undone by calling entry[0].undo(entry[1]). For a
+       pruned value that is var.undo(code), i.e. var.restoreCode(code);
+       other reversible objects (e.g., the bounds of 'interval' domains,
+       see pruneBounds) can save their state on the trail with save().
+       The current domain of a 'sparse' variable is saved as its size,
+       once per level, so that undoing a level restores it with one
+       resize.
+
+       Every search owns its own trail, so nothing is shared between
+       successive or concurrent searches. Values pruned before the first
+       call to newLevel() (e.g., at the root) are never restored.
+    '''
+    def __init__(self):
+        self._entries = []     #(var, code) pairs (or (obj, state)) in the order they were pruned
+        self._marks = []       #size of _entries at the start of each level
+        self._token = object() #identifies the current level, see prune
+
+    def prune(self, var, code):
+        '''prune the value with code code from var's current domain and record it'''
+        domain = var.sparseDomain()
+        if domain is None:
+            self._entries.append((var, code))
+        elif domain.mark(self._token):
+            self._entries.append((domain, len(domain)))   #first pruning in this level
+        var.pruneCode(code)
+
+    def save(self, obj, state):
+        '''record that obj.undo(state) must be called when the current
+           level is undone'''
+        self._entries.append((obj, state))
+
+    def pruneBounds(self, var, lo, hi):
+        '''prune every value of var below lo or above hi (the values must
+           be comparable). For an 'interval' variable both bounds are
+           moved at once and recorded as a single entry, otherwise each
+           value is pruned and recorded. Return True if anything was
+           pruned.'''
+        domain = var.intervalDomain()
+        if domain is None:
+            pruned = False
+            for code in var.curDomainCodes():
+                val = var.valueOf(code)
+                if val < lo or val > hi:
+                    self.prune(var, code)
+                    pruned = True
+            return pruned
+        start = var.domainView().start
+        saved = domain.keep(lo - start, hi - start)
+        if saved is None:
+            return False
+        self._entries.append((domain, saved))
+        return True
+
+    def newLevel(self):
+        self._marks.append(len(self._entries))
+        self._token = object()
+
+    def undoLevel(self):
+        '''restore all values pruned since the last newLevel()'''
+        mark = self._marks.pop()
+        entries = self._entries
+        for i in range(len(entries) - 1, mark - 1, -1):
+            obj, datum = entries[i]
+            obj.undo(datum)
+        del entries[mark:]
+        self._token = object()
+
+    def level(self):
+        return len(self._marks)
+
+class PropagationQueue:
+    '''FIFO queue of the constraints waiting to be revised by GacEnforce.
+       A constraint is in the queue at most once: pushing a constraint
+       that is already waiting does nothing. The constraints are kept in
+       a deque and the set of waiting constraints serves as their
+       in-queue flags, so push() and pop() are O(1).
+
+       The queue is owned by a Solver and never shares a list with its
+       callers.
+    '''
+    def __init__(self):
+        self._queue = deque()
+        self._queued = set()   #the constraints in _queue
+
+    def push(self, cnstr):
+        if cnstr not in self._queued:
+            self._queued.add(cnstr)
+            self._queue.append(cnstr)
+
+    def pushAll(self, constraints, skip=None):
+        '''push every constraint of constraints except skip'''
+        queued = self._queued
+        for cnstr in constraints:
+            if cnstr is not skip and cnstr not in queued:
+                queued.add(cnstr)
+                self._queue.append(cnstr)
+
+    def pop(self):
+        '''remove and return the constraint that has waited the longest'''
+        cnstr = self._queue.popleft()
+        self._queued.discard(cnstr)
+        return cnstr
+
+    def empty(self):
+        return not self._queue
+
+    def clear(self):
+        self._queue.clear()
+        self._queued.clear()
+
+    def __len__(self):
+        return len(self._queue)
+
+class Solver:
+    '''Search context for solving one CSP with backtracking search.
+
+       A Solver owns all the state of a search: the statistics, the trail
+       of pruned values, the propagation queue of GacEnforce and the set
+       of unassigned variables used by the variable heuristic. Nothing
+       is kept in globals or on the Variable class, so independent CSPs
+       can be solved at the same time in different threads, and a CSP
+       (or a Solver) can be pickled and solved in a worker process. The
+       variables' values and current domains live in the CSP itself, so
+       one CSP object must not be searched by two Solvers at the same
+       time.
+
+       csp is the CSP object to solve, variableHeuristic and trace are
+       as for bt_search. If seed is given the 'random' heuristic uses
+       its own random number generator seeded with it, otherwise it
+       uses the random module.
+    '''
+    varHeuristics = ['random', 'fixed', 'mrv']
+    algorithms = ['BT', 'FC', 'GAC']
+
+    def __init__(self, csp, variableHeuristic='fixed', trace=False, seed=None):
+        if variableHeuristic not in Solver.varHeuristics:
+            print("Error. Unknown variable heursitics {}. Must be one of {}.".format(
+                variableHeuristic, Solver.varHeuristics))
+        self.csp = csp
+        self.variableHeuristic = variableHeuristic
+        self.trace = trace
+        #None stands for the random module, which cannot be pickled
+        self.rng = None if seed is None else random.Random(seed)
+        self.trail = Trail()
+        self.queue = PropagationQueue()
+        self.unassigned = None
+        #statistics
+        self.nodesExplored = 0
+        self.constraintChecks = 0   #made by the constraints' hasSupport, see Constraint.checks
+
+    def solve(self, algo, allSolutions):
+        '''Run search algorithm algo (one of ['BT', 'FC', 'GAC']) from
+           scratch and return the list of solutions found. Each solution
+           is a list of (var, value) pairs.'''
+        if algo not in Solver.algorithms:
+            print("Error. Unknown algorithm heursitics {}. Must be one of {}.".format(
+                algo, Solver.algorithms))
+
+        csp = self.csp
+        self.nodesExplored = 0
+        for cnstr in csp.constraintsView():
+            cnstr.reset()
+        self.trail = Trail()
+        self.queue.clear()
+        self.unassigned = UnassignedVars(self.variableHeuristic, csp, self.rng)
+        for v in csp.variablesView():
+            v.reset()
+        solutions = []
+        if algo == 'BT':
+            solutions = self.BT(allSolutions)
+        elif algo == 'FC':
+            DWO = False
+            for cnstr in csp.constraintsView():
+                if cnstr.arity() == 1:
+                    #FC with unary constraints at the root
+                    if self.FCCheck(cnstr, None, None) == "DWO":
+                        DWO = True
+                        break
+            if not DWO:
+                solutions = self.FC(allSolutions)
+        elif algo == 'GAC':
+            if self.GacEnforce(csp.constraintsView(), None, None) != "DWO": #GAC at the root
+                solutions = self.GAC(allSolutions)
+        self.constraintChecks = sum([cnstr.checks() for cnstr in csp.constraintsView()])
+        return solutions
+
+    def solution(self):
+        '''return the current (complete) assignment as a list of (var, value) pairs'''
+        return [(v, v.getValue()) for v in self.csp.variablesView()]
+
+    def BT(self, allSolutions):
+        '''Backtracking Search. allSolutions is True if you want all
+           solutions. Returns the set of solutions found.
+
+          To handle finding 'allSolutions', at every stage we collect
+          up the solutions returned by the recursive  calls, and
+          then return a list of all of them.
+
+          If we are only looking for one solution we stop trying
+          further values of the variable currently being tried as
+          soon as one of the recursive calls returns some solutions.
+        '''
+        csp = self.csp
+        trace = self.trace
+        unAssignedVars = self.unassigned
+        if unAssignedVars.empty():
+            if trace: print("{} Solution Found".format(csp.name()))
+            return [self.solution()]  #each call returns a list of solutions found
+        self.nodesExplored += 1
+        solns = []         #so far we have no solutions recursive calls
+        nxtvar = unAssignedVars.extract()
+        if trace: print("==>Trying {}".format(nxtvar.name()))
+        for code in range(nxtvar.domainSize()):
+            nxtvar.setCode(code)
+            if trace: print("==> {} = {}".format(nxtvar.name(), nxtvar.getValue()))
+            constraintsOK = True
+            for cnstr in csp.adjacentConstraints(nxtvar):
+                if cnstr.numUnassigned() == 0:
+                    if not cnstr.check():
+                        constraintsOK = False
+                        if trace: print("<==falsified constraint\n")
+                        break
+            if constraintsOK:
+                new_solns = self.BT(allSolutions)
+                if new_solns:
+                    solns.extend(new_solns)
+                if len(solns) > 0 and not allSolutions:
+                    break #don't bother with other values of nxtvar
+                          #as we found a soln.
+        nxtvar.unAssign()
+        unAssignedVars.insert(nxtvar)
+        return solns
+
+    def FCCheck(self, cnstr, reasonVar, reasonVal):
+        '''cnstr is the constraint where every variables but one are assigned.
+           reasonVar is an assigned variable to check against the sole unassigned variable, var.
+           reasonVal is the value assigned to reasonVar.
+
+           When we prune val from var, reasonVar = reasonVal is the reason why the pruning occurred.
+           Pruned values are recorded on the solver's trail.
+        '''
+        if cnstr.numUnassigned() != 1:
+            print("Error FCCheck called on constraint {} with {} neq 1 unassigned vars".format(cnstr.name(), cnstr.numUnassigned()))
+        var = cnstr.lastUnassignedVar()
+        #with every other variable assigned, a value is supported iff
+        #assigning it satisfies the constraint
+        for code in cnstr.revise(var):
+            self.trail.prune(var, code)
+        if var.curDomainSize() == 0:
+            return "DWO"
+        return "OK"
+
+    def FC(self, allSolutions):
+        '''Forward checking search. allSolutions is True if you want
+           all solutions.
+
+           RETURNS LIST OF ALL SOLUTIONS FOUND.
+
+           Finding allSolutions is handled just as it was in BT.  Except
+           that when we are not looking for all solutions and we stop
+           early because one of the recursive calls found a solution we
+           must make sure that we restore all pruned values before
+           returning. Pruned values are recorded on the trail, one level
+           per value tried.
+        '''
+        # Normally argument is "Level"
+        csp = self.csp
+        trail = self.trail
+        unAssignedVars = self.unassigned
+
+        # If all variables are assigned return with the solution
+        if unAssignedVars.empty():
+            return [self.solution()]
+
+        solutions = []
+        self.nodesExplored += 1
+        # Pick an unassigned variable
+        variable = unAssignedVars.extract()
+
+        # Loop through all possible values of the unassigned variable
+        for code in variable.curDomainCodes():
+            variable.setCode(code)
+            trail.newLevel()
+            DWO = False
+
+            #for each constraint C over V such that C has only one unassigned variable X in its scope
+            for const in csp.adjacentConstraints(variable):
+                if const.numUnassigned() == 1:
+                    if self.FCCheck(const, variable, variable.getValue()) == "DWO":
+                        DWO = True
+                        break
+
+            # All constraints were okay
+            if DWO == False:
+            # FC(Level + 1)
+                solutions.extend(self.FC(allSolutions))
+                if len(solutions) > 0 and not allSolutions:
+                    trail.undoLevel()
+                    break
+            trail.undoLevel()
+
+        variable.setValue(None)
+        unAssignedVars.insert(variable)
+
+        return solutions
+
+    def GacEnforce(self, constraints, reasonVar, reasonVal):
+        '''Establish GAC on constraints by pruning values
+           from the current domains of the variables.
+           Return "OK" if completed "DWO" if found
+           a domain wipe out.
+
+           Similar to FCCheck, reasonVar is an assigned variable with value reasonVal.
+           The pruning of the values from the variables are due to reasonVar = reasonVal
+           Pruned values are recorded on the solver's trail.
+
+           The constraints are copied onto the solver's propagation queue,
+           so constraints is never modified.
+        '''
+        # Pseudocode:
+        # while GACQueue not empty
+        #     C = GACQueue.extract()
+        #     for V := each member of scope(C)
+        #         for d := CurDom[V]
+        #             Find an assignment A for all other
+        #             variables in scope(C) such that
+        #             C(A ∪ V=d) = True
+        #             if A not found
+        #                 CurDom[V] = CurDom[V] – d
+        #                 if CurDom[V] = ∅
+        #                     empty GACQueue
+        #                     return DWO //return immediately
+        #                 else
+        #                     push all constraints C’ such that
+        #                     V ∈ scope(C’) and C’ ∉ GACQueue
+        #                     on to GACQueue
+        # return TRUE //while loop exited without DWO
+        csp = self.csp
+        trail = self.trail
+        queue = self.queue
+        queue.pushAll(constraints)
+
+        # While GAC queue not empty:
+        while not queue.empty():
+            # Extract constraint
+            const = queue.pop()
+
+            # revise the whole scope at once if C has its own propagator
+            pruned = const.propagate(trail)
+            if pruned is not None:
+                if pruned == "DWO":
+                    queue.clear()
+                    return "DWO"
+                for variable in pruned:
+                    queue.pushAll(csp.adjacentConstraints(variable), const)
+                continue
+
+            # for V := each member of scope(C)
+            for variable in const.scopeView():
+
+                # for d := CurDom[V]: find an assignment A for all other
+                # variables in scope(C) such that C(A ∪ V = d) == True.
+                # revise returns the values of V for which there is none.
+                unsupported = const.revise(variable)
+                if unsupported:
+                    # Prune values:
+                    for code in unsupported:
+                        trail.prune(variable, code)
+                    # If the variable has no current domain that means DWO
+                    if variable.curDomainSize() == 0:
+                        queue.clear()
+                        return "DWO"
+
+                    queue.pushAll(csp.adjacentConstraints(variable), const)
+
+        return "OK"
+
+    def GAC(self, allSolutions):
+        '''GAC search. allSolutions is True if you want all solutions.
+
+           RETURNS LIST OF ALL SOLUTIONS FOUND.
+
+           Finding allSolutions is handled just as it was in BT.  Except
+           that when we are not looking for all solutions and we stop
+           early because one of the recursive calls found a solution we
+           must make sure that we restore all pruned values before
+           returning. Pruned values are recorded on the trail, one level
+           per value tried.
+        '''
+        # Pseudocode:
+        # If all variables are assigned
+        #     PRINT Value of each Variable
+        #     RETURN or EXIT (RETURN for more solutions)
+        #                    (EXIT for only one solution)
+        # V := PickAnUnassignedVariable()
+        # Assigned[V] := TRUE
+        # for d := each member of CurDom(V)
+        #     Value[V] := d
+        #     Prune all values of V ≠ d from CurDom[V]
+        #     for each constraint C whose scope contains V
+        #        Put C on GACQueue
+        #     if(GAC_Enforce() != DWO)
+        #        GAC(Level+1) /*all constraints were ok*/
+        #     RestoreAllValuesPrunedFromCurDoms()
+        # Assigned[V] := FALSE
+        # return;
+        csp = self.csp
+        trail = self.trail
+        unAssignedVars = self.unassigned
+
+        # If all variables are assigned:
+        if unAssignedVars.empty():
+            # Return solutions
+            return [self.solution()]
+
+        solutions = []
+        self.nodesExplored += 1
+        # Extract a variable:
+        variable = unAssignedVars.extract()
+
+        # For all of the values that the variable can adopt:
+        for code in variable.curDomainCodes():
+            # Set the value of the variable to the current variable iteration
+            variable.setCode(code)
+            trail.newLevel()
+            DWO = False
+            if self.GacEnforce(csp.adjacentConstraints(variable), variable, variable.getValue()) == "DWO":
+                DWO = True
+            if not DWO:
+                # Just as in FC we recursively call GAC if there is no DWO
+                # GAC(Level+1):
+                solutions.extend(self.GAC(allSolutions))
+                if len(solutions) > 0 and not allSolutions:
+                    trail.undoLevel()
+                    break
+            # This line will immediately execute if there is a DWO
+            trail.undoLevel()
+
+        variable.setValue(None)
+        unAssignedVars.insert(variable)
+
+        return solutions
+
 def bt_search(algo, csp, variableHeuristic, allSolutions, trace):
     '''Main interface routine for calling different forms of backtracking search
        algorithm is one of ['BT', 'FC', 'GAC']
@@ -59,300 +514,47 @@ def bt_search(algo, csp, variableHeuristic, allSolutions, trace):
        allSolutions True or False. True means we want to find all solutions.
        trace True of False. True means turn on tracing of the algorithm
 
-       bt_search returns a list of solutions. Each solution is itself a list
-       of pairs (var, value). Where var is a Variable object, and value is
-       a value from its domain.
+       bt_search returns a list of solutions and the number of nodes
+       explored. Each solution is itself a list of pairs (var, value).
+       Where var is a Variable object, and value is a value from its domain.
+
+       bt_search is a thin wrapper around a fresh Solver, so calls on
+       different CSP objects can run concurrently.
     '''
-    varHeuristics = ['random', 'fixed', 'mrv']
-    algorithms = ['BT', 'FC', 'GAC']
+    solver = Solver(csp, variableHeuristic, trace)
+    solutions = solver.solve(algo, allSolutions)
+    return solutions, solver.nodesExplored
 
-    #statistics
-    bt_search.nodesExplored = 0
-
-    if variableHeuristic not in varHeuristics:
-        print("Error. Unknown variable heursitics {}. Must be one of {}.".format(
-            variableHeuristic, varHeuristics))
-    if algo not in algorithms:
-        print("Error. Unknown algorithm heursitics {}. Must be one of {}.".format(
-            algo, algorithms))
-
-    uv = UnassignedVars(variableHeuristic,csp)
-    Variable.clearUndoDict()
-    for v in csp.variables():
-        v.reset()
-    if algo == 'BT':
-         solutions = BT(uv, csp, allSolutions, trace)
-    elif algo == 'FC':
-        for cnstr in csp.constraints():
-            if cnstr.arity() == 1:
-                FCCheck(cnstr, None, None)  #FC with unary constraints at the root
-        solutions = FC(uv, csp, allSolutions, trace)
-    elif algo == 'GAC':
-        GacEnforce(csp.constraints(), csp, None, None) #GAC at the root
-        solutions = GAC(uv, csp, allSolutions, trace)
-
-    return solutions, bt_search.nodesExplored
+#The functions below run one part of the search on its own, in a fresh
+#Solver. They are kept for code that calls them directly (e.g., to test
+#GacEnforce on a small CSP).
 
 def BT(unAssignedVars, csp, allSolutions, trace):
-    '''Backtracking Search. unAssignedVars is the current set of
-       unassigned variables.  csp is the csp problem, allSolutions is
-       True if you want all solutionss trace if you want some tracing
-       of variable assignments tried and constraints failed. Returns
-       the set of solutions found.
-
-      To handle finding 'allSolutions', at every stage we collect
-      up the solutions returned by the recursive  calls, and
-      then return a list of all of them.
-
-      If we are only looking for one solution we stop trying
-      further values of the variable currently being tried as
-      soon as one of the recursive calls returns some solutions.
-    '''
-    if unAssignedVars.empty():
-        if trace: print("{} Solution Found".format(csp.name()))
-        soln = []
-        for v in csp.variables():
-            soln.append((v, v.getValue()))
-        return [soln]  #each call returns a list of solutions found
-    bt_search.nodesExplored += 1
-    solns = []         #so far we have no solutions recursive calls
-    nxtvar = unAssignedVars.extract()
-    if trace: print("==>Trying {}".format(nxtvar.name()))
-    for val in nxtvar.domain():
-        if trace: print("==> {} = {}".format(nxtvar.name(), val))
-        nxtvar.setValue(val)
-        constraintsOK = True
-        for cnstr in csp.constraintsOf(nxtvar):
-            if cnstr.numUnassigned() == 0:
-                if not cnstr.check():
-                    constraintsOK = False
-                    if trace: print("<==falsified constraint\n")
-                    break
-        if constraintsOK:
-            new_solns = BT(unAssignedVars, csp, allSolutions, trace)
-            if new_solns:
-                solns.extend(new_solns)
-            if len(solns) > 0 and not allSolutions:
-                break #don't bother with other values of nxtvar
-                      #as we found a soln.
-    nxtvar.unAssign()
-    unAssignedVars.insert(nxtvar)
-    return solns
+    '''Backtracking search from the current assignment, see Solver.BT'''
+    solver = Solver(csp, trace=trace)
+    solver.unassigned = unAssignedVars
+    return solver.BT(allSolutions)
 
 def FCCheck(cnstr, reasonVar, reasonVal):
-    '''cnstr is the constraint where every variables but one are assigned.
-       reasonVar is an assigned variable to check against the sole unassigned variable, var.
-       reasonVal is the value assigned to reasonVar.
-
-       When we prune val from var, reasonVar = reasonVal is the reason why the pruning occurred.
-    '''
-
-    if cnstr.numUnassigned() != 1:
-        print("Error FCCheck called on constraint {} with {} neq 1 unassigned vars".format(cnstr.name(), cnstr.numUnassignedVars))
-    var = cnstr.unAssignedVars()[0]
-    for val in var.curDomain():
-        var.setValue(val)
-        if not cnstr.check():
-            var.pruneValue(val, reasonVar, reasonVal)
-        var.unAssign()  #NOTE WE MUST UNDO TRIAL ASSIGNMENT
-    if var.curDomainSize() == 0:
-        return "DWO"
-    return "OK"
+    '''Forward check cnstr, see Solver.FCCheck. Pruned values are not restored.'''
+    return Solver(None).FCCheck(cnstr, reasonVar, reasonVal)
 
 def FC(unAssignedVars, csp, allSolutions, trace):
-    '''Forward checking search.
-       unAssignedVars is the current set of
-       unassigned variables.  csp is the csp
-       problem, allSolutions is True if you want all solutionsl trace
-       if you want some tracing of variable assignments tried and
-       constraints failed.
-
-       RETURNS LIST OF ALL SOLUTIONS FOUND.
-
-       Finding allSolutions is handled just as it was in BT.  Except
-       that when we are not looking for all solutions and we stop
-       early because one of the recursive calls found a solution we
-       must make sure that we restore all pruned values before
-       returning.
-    '''
-    #your implementation for Question 2 goes in this function body.
-    #you must not change the function parameters.
-    #Implementing handling of the trace parameter is optional
-    #but it can be useful for debugging
-    
-    # Normally argument is "Level"
-    # Arguments in this function are unAssignedVars, csp, allSolutions, trace
-
-    solutions = []
-    # If all variables are assigned return with the solution
-    if unAssignedVars.empty():
-
-        for variable in csp.variables():
-            solutions.append((variable, variable.getValue()))
-
-        return [solutions]
-
-    bt_search.nodesExplored += 1
-    # Pick an unassigned variable
-    variable = unAssignedVars.extract()
-
-    # Loop through all possible values of the unassigned variable
-    for value in variable.curDomain():
-        variable.setValue(value)
-        DWO = False
-
-        #for each constraint C over V such that C has only one unassigned variable X in its scope
-        for const in csp.constraintsOf(variable):
-            if const.numUnassigned() == 1:
-                if FCCheck(const, variable, value) == "DWO":
-                    DWO = True
-                    break
-
-        # All constraints were okay
-        if DWO == False:
-        # FC(Level + 1)
-            solutions.extend(FC(unAssignedVars, csp, allSolutions, trace))
-            if len(solutions) > 0 and not allSolutions:
-                variable.restoreValues(variable, value)
-                break
-        variable.restoreValues(variable, value)
-
-    variable.setValue(None)
-    unAssignedVars.insert(variable)
-
-    return solutions
+    '''Forward checking search from the current assignment, see Solver.FC'''
+    solver = Solver(csp, trace=trace)
+    solver.unassigned = unAssignedVars
+    return solver.FC(allSolutions)
 
 def GacEnforce(constraints, csp, reasonVar, reasonVal):
-    '''Establish GAC on constraints by pruning values
-       from the current domains of the variables.
-       Return "OK" if completed "DWO" if found
-       a domain wipe out.
-       
-       Similar to FCCheck, reasonVar is an assigned variable with value reasonVal.
-       The pruning of the values from the variables are due to reasonVar = reasonVal
-    '''
-    # your implementation for Question 3 goes in this function body
-    # you must not change the function parameters
-    # ensure that you return one of "OK" or "DWO"
-
-    # Pseudocode: 
-    # while GACQueue not empty
-    #     C = GACQueue.extract()
-    #     for V := each member of scope(C)
-    #         for d := CurDom[V]
-    #             Find an assignment A for all other
-    #             variables in scope(C) such that
-    #             C(A ∪ V=d) = True
-    #             if A not found
-    #                 CurDom[V] = CurDom[V] – d
-    #                 if CurDom[V] = ∅
-    #                     empty GACQueue
-    #                     return DWO //return immediately
-    #                 else
-    #                     push all constraints C’ such that
-    #                     V ∈ scope(C’) and C’ ∉ GACQueue
-    #                     on to GACQueue
-    # return TRUE //while loop exited without DWO
-
-    # While GAC queue not empty:
-    while len(constraints) != 0:
-        # Extract constraint
-        const = constraints.pop(0)
-
-        # for V := each member of scope(C)
-        for variable in const.scope():
-
-            # for d := CurDom[V]
-            for value in variable.curDomain():
-                # Find an assignment A for all other variables in scope(C) 
-                # such that C(A ∪ V = d) == True
-                if not const.hasSupport(variable, value):
-                    # Prune value:
-                    variable.pruneValue(value, reasonVar, reasonVal)
-                    # If the variable has no current domain that means DWO
-                    if variable.curDomainSize() == 0:
-                        return "DWO"
-
-                    for check in csp.constraintsOf(variable):
-                        if check != const and not check in constraints:
-                            constraints.append(check)
-
-    return "OK"
+    '''Establish GAC on constraints, see Solver.GacEnforce. Pruned values
+       are not restored. The constraints are reset first, the domains may
+       have changed since they last propagated.'''
+    for cnstr in constraints:
+        cnstr.reset()
+    return Solver(csp).GacEnforce(constraints, reasonVar, reasonVal)
 
 def GAC(unAssignedVars, csp, allSolutions, trace):
-    '''GAC search.
-       unAssignedVars is the current set of
-       unassigned variables.  csp is the csp
-       problem, allSolutions is True if you want all solutionsl trace
-       if you want some tracing of variable assignments tried and
-       constraints failed.
-
-       RETURNS LIST OF ALL SOLUTIONS FOUND.
-
-       Finding allSolutions is handled just as it was in BT.  Except
-       that when we are not looking for all solutions and we stop
-       early because one of the recursive calls found a solution we
-       must make sure that we restore all pruned values before
-       returning.
-    '''
-    #your implementation for Question 3 goes in this function body
-    #You must not change the function parameters.
-    #implementing support for "trace" is optional, but it might
-    #help you in debugging
-
-    # Pseudocode:
-    # If all variables are assigned
-    #     PRINT Value of each Variable
-    #     RETURN or EXIT (RETURN for more solutions)
-    #                    (EXIT for only one solution)
-    # V := PickAnUnassignedVariable()
-    # Assigned[V] := TRUE
-    # for d := each member of CurDom(V)
-    #     Value[V] := d
-    #     Prune all values of V ≠ d from CurDom[V]
-    #     for each constraint C whose scope contains V
-    #        Put C on GACQueue
-    #     if(GAC_Enforce() != DWO)
-    #        GAC(Level+1) /*all constraints were ok*/
-    #     RestoreAllValuesPrunedFromCurDoms()
-    # Assigned[V] := FALSE
-    # return; 
-
-    solutions = []
-    # If all variables are assigned:
-    if unAssignedVars.empty():
-
-        for variable in csp.variables():
-            solutions.append((variable, variable.getValue()))
-
-        # Return solutions
-        return [solutions]
-
-    bt_search.nodesExplored += 1
-    # Extract a variable:
-    variable = unAssignedVars.extract()
-
-    # For all of the values that the variable can adopt:
-    for value in variable.curDomain():
-        # Set the value of the variable to the current variable iteration
-        variable.setValue(value)
-        DWO = False
-        if GacEnforce(csp.constraintsOf(variable), csp, variable, value) == "DWO":
-            DWO = True
-        if not DWO:
-            # Just as in FC we recursively call GAC if there is no DWO
-            # GAC(Level+1):
-            solutions.extend(GAC(unAssignedVars, csp, allSolutions, trace))
-            if len(solutions) > 0 and not allSolutions:
-                variable.restoreValues(variable, value)
-                break
-        # This line will immediately execute if there is a DWO
-        variable.restoreValues(variable, value)
-
-    variable.setValue(None)
-    unAssignedVars.insert(variable)
-
-    return solutions
-
-
-    
\ No newline at end of file
+    '''GAC search from the current assignment, see Solver.GAC'''
+    solver = Solver(csp, trace=trace)
+    solver.unassigned = unAssignedVars
+    return solver.GAC(allSolutions)
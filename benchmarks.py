@@ -0,0 +1,335 @@
+'''Benchmarks for the CSP solver.
+
+   Run
+       python3 benchmarks.py allocations -n 8
+   to time a search on the n-Queens models and count the list copies
+   it allocates, and
+       python3 benchmarks.py construction -n 200
+   to measure the time and memory needed to build the n-Queens models, and
+       python3 benchmarks.py tables -n 8
+   to compare the GAC propagators of table constraints on the n-Queens
+   table model and the class scheduling problems, and
+       python3 benchmarks.py compression -n 8
+   to report how much smaller the MDDs of the same tables are, and
+       python3 benchmarks.py alldiff -n 8
+   to compare the consistencies of AllDiffConstraint on n-Queens and
+   permutation problems, and
+       python3 benchmarks.py support -n 8
+   to time the support checks of the binary n-Queens constraints, and
+       python3 benchmarks.py queue -n 8
+   to time GAC on the n-Queens alldiff model with the propagation queue
+   of the solver and with a plain list, and
+       python3 benchmarks.py domains -n 8
+   to compare the representations of the current domains of variables.
+'''
+import csp_problems
+from backtracking import bt_search, Solver, PropagationQueue, Trail
+from constraints import AllDiffConstraint, clearTableCaches
+from csp import Variable, CSP
+import argparse
+import random
+import contextlib
+import io
+import cProfile
+import pstats
+import time
+import tracemalloc
+
+#accessors in csp.py that return a freshly allocated copy on every call
+COPYING_METHODS = ['scope', 'unAssignedVars', 'domain', 'curDomain', 'variables',
+                   'constraints', 'constraintsOf']
+
+def allocations(n, models, algos, heuristic='fixed'):
+    '''Solve n-Queens (all solutions) with each model and algorithm and
+       report the time taken and the number of defensive copies made by
+       the copying accessors of Variable, Constraint and CSP (each call
+       allocates a new list). The copies are counted by profiling a
+       second run of the search.'''
+    print("{:8} {:4} {:>9} {:>10} {:>12}".format(
+        "model", "algo", "nodes", "time (s)", "copies"))
+    for model in models:
+        for algo in algos:
+            csp = csp_problems.nQueens(n, model)
+            start = time.perf_counter()
+            solutions, nodes = bt_search(algo, csp, heuristic, True, False)
+            elapsed = time.perf_counter() - start
+
+            profile = cProfile.Profile()
+            profile.runcall(bt_search, algo, csp, heuristic, True, False)
+            copies = 0
+            for (filename, line, func), stat in pstats.Stats(profile).stats.items():
+                if filename.endswith('csp.py') and func in COPYING_METHODS:
+                    copies += stat[1]    #number of calls
+            print("{:8} {:4} {:>9} {:>10.3f} {:>12}".format(
+                model, algo, nodes, elapsed, copies))
+
+def construction(n, models):
+    '''Build the n-Queens CSP for each model and report the time taken and
+       the memory still allocated (traced by tracemalloc) once it is built.
+       The tables shared between constraints are built again for each
+       measurement.'''
+    print("{:8} {:>12} {:>10} {:>12}".format(
+        "model", "constraints", "time (s)", "memory (KiB)"))
+    for model in models:
+        clearTableCaches()
+        start = time.perf_counter()
+        csp = csp_problems.nQueens(n, model)
+        elapsed = time.perf_counter() - start
+        del csp
+
+        clearTableCaches()
+        tracemalloc.start()
+        csp = csp_problems.nQueens(n, model)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("{:8} {:>12} {:>10.3f} {:>12.1f}".format(
+            model, len(csp.constraintsView()), elapsed, memory / 1024))
+
+def tableProblems(n):
+    '''return (name, CSP) for the n-Queens table model and the class
+       scheduling problems of class_scheduling.py'''
+    import class_scheduling
+    problems = [("queens-{}".format(n), csp_problems.nQueens(n, 'table'))]
+    for name in ['c1', 'c2', 'c3', 'c4', 'c5', 'c6', 'c7']:
+        with contextlib.redirect_stdout(io.StringIO()):   #check_schedule_solution reports every invalid schedule
+            problems.append((name, csp_problems.schedule_csp(getattr(class_scheduling, name))))
+    return problems
+
+def tables(n, propagators):
+    '''Solve (all solutions, GAC, mrv) the n-Queens table model and the
+       class scheduling problems of class_scheduling.py with every table
+       constraint using each propagator, and report the time taken, the
+       nodes explored and the constraint checks made.'''
+    print("{:10} {:>8} {:8} {:>9} {:>10} {:>10}".format(
+        "problem", "tuples", "prop", "nodes", "checks", "time (s)"))
+    for name, csp in tableProblems(n):
+        tuples = sum([len(c.satAssignments) for c in csp.constraintsView()])
+        for propagator in propagators:
+            for cnstr in csp.constraintsView():
+                cnstr.setPropagator(propagator)
+            solver = Solver(csp, 'mrv')
+            start = time.perf_counter()
+            solver.solve('GAC', True)
+            elapsed = time.perf_counter() - start
+            print("{:10} {:>8} {:8} {:>9} {:>10} {:>10.3f}".format(
+                name, tuples, propagator, solver.nodesExplored, solver.constraintChecks, elapsed))
+
+def compression(n):
+    '''Report the size of the tables of the problems of tables() as flat
+       tables (number of tuples times arity) and as MDDs (edges), and the
+       time taken to compile the MDDs. Tables shared between constraints
+       are counted once.'''
+    print("{:10} {:>8} {:>10} {:>8} {:>8} {:>7} {:>10}".format(
+        "problem", "tuples", "cells", "nodes", "edges", "ratio", "time (s)"))
+    for name, csp in tableProblems(n):
+        tables = dict()
+        for cnstr in csp.constraintsView():
+            tables[id(cnstr.tupleTable())] = (cnstr.tupleTable(), cnstr.arity())
+        tuples = cells = nodes = edges = 0
+        start = time.perf_counter()
+        for table, arity in tables.values():
+            mdd = table.mdd()
+            tuples += len(table.codeTuples)
+            cells += len(table.codeTuples) * arity
+            nodes += mdd.numNodes()
+            edges += mdd.numEdges()
+        elapsed = time.perf_counter() - start
+        print("{:10} {:>8} {:>10} {:>8} {:>8} {:>7.2f} {:>10.3f}".format(
+            name, tuples, cells, nodes, edges, cells / max(edges, 1), elapsed))
+
+def pigeonholes(n):
+    '''n pigeons in n-1 holes (no solution)'''
+    pigeons = [Variable('P{}'.format(i), list(range(n - 1))) for i in range(n)]
+    return CSP("{}-Pigeons".format(n), pigeons, [AllDiffConstraint('holes', pigeons)])
+
+def latinSquare(n):
+    '''an n x n grid where the values of every row and every column are
+       a permutation of 1..n'''
+    grid = [[Variable('V{},{}'.format(i, j), list(range(1, n + 1))) for j in range(n)]
+            for i in range(n)]
+    cons = [AllDiffConstraint('row{}'.format(i), grid[i]) for i in range(n)]
+    cons += [AllDiffConstraint('col{}'.format(j), [grid[i][j] for i in range(n)])
+             for j in range(n)]
+    return CSP("{}-Latin".format(n), [v for row in grid for v in row], cons)
+
+def alldiff(n, consistencies):
+    '''Solve (GAC, mrv) the n-Queens alldiff model (all solutions),
+       n+1 pigeons in n holes and an n x n latin square (first solution)
+       with every AllDiffConstraint enforcing each consistency, and report
+       the nodes explored, the constraint checks made and the time taken.'''
+    problems = [("queens-{}".format(n), csp_problems.nQueens(n, 'alldiff'), True),
+                ("pigeons-{}".format(n + 1), pigeonholes(n + 1), True),
+                ("latin-{}".format(n), latinSquare(n), False)]
+    print("{:12} {:8} {:>9} {:>10} {:>10}".format(
+        "problem", "level", "nodes", "checks", "time (s)"))
+    for name, csp, allSolutions in problems:
+        for consistency in consistencies:
+            for cnstr in csp.constraintsView():
+                if isinstance(cnstr, AllDiffConstraint):
+                    cnstr.setConsistency(consistency)
+            solver = Solver(csp, 'mrv')
+            start = time.perf_counter()
+            solver.solve('GAC', allSolutions)
+            elapsed = time.perf_counter() - start
+            print("{:12} {:8} {:>9} {:>10} {:>10.3f}".format(
+                name, consistency, solver.nodesExplored, solver.constraintChecks, elapsed))
+
+def scanSupport(cnstr, var, val):
+    '''the generic support check for a constraint over two unassigned
+       variables: try every value of the other variable'''
+    other = [v for v in cnstr.scopeView() if v is not var][0]
+    var.setValue(val)
+    found = False
+    for otherVal in other.curDomain():
+        other.setValue(otherVal)
+        found = cnstr.check()
+        other.unAssign()
+        if found:
+            break
+    var.unAssign()
+    return found
+
+def support(n, models, rounds=5):
+    '''Prune the domains of the n-Queens CSP at random (to sizes from 1 to
+       n) and time hasSupport for every value of every variable of every
+       binary QueensConstraint and NeqConstraint, against the generic
+       scanSupport.'''
+    print("{:8} {:>9} {:>14} {:>14} {:>8}".format(
+        "model", "calls", "hasSupport (s)", "scan (s)", "speedup"))
+    rng = random.Random(0)
+    for model in models:
+        if model == 'table':
+            continue    #table constraints have their own support index
+        csp = csp_problems.nQueens(n, model)
+        cnstrs = [c for c in csp.constraintsView() if c.arity() == 2 and
+                  type(c).__name__ in ('QueensConstraint', 'NeqConstraint')]
+        calls = fast = scan = 0
+        for r in range(rounds):
+            for v in csp.variablesView():
+                v.reset()
+                for val in rng.sample(v.domain(), n - rng.randint(1, n)):
+                    v.pruneValue(val)
+            queries = [(c, v, val) for c in cnstrs for v in c.scopeView() for val in v.curDomain()]
+            start = time.perf_counter()
+            expected = [c.hasSupport(v, val) for c, v, val in queries]
+            fast += time.perf_counter() - start
+            start = time.perf_counter()
+            found = [scanSupport(c, v, val) for c, v, val in queries]
+            scan += time.perf_counter() - start
+            if found != expected:
+                print("Error hasSupport and scanSupport disagree on the {} model".format(model))
+            calls += len(queries)
+        print("{:8} {:>9} {:>14.3f} {:>14.3f} {:>8.1f}".format(
+            model, calls, fast, scan, scan / max(fast, 1e-9)))
+
+class ListQueue(PropagationQueue):
+    '''a propagation queue kept in a plain list, as GacEnforce used to do:
+       pop() is O(n) and every push scans the list'''
+    def __init__(self):
+        self._list = []
+
+    def push(self, cnstr):
+        self.pushAll([cnstr])
+
+    def pushAll(self, constraints, skip=None):
+        for cnstr in constraints:
+            if cnstr is not skip and not cnstr in self._list:
+                self._list.append(cnstr)
+
+    def pop(self):
+        return self._list.pop(0)
+
+    def empty(self):
+        return not self._list
+
+    def clear(self):
+        del self._list[:]
+
+    def __len__(self):
+        return len(self._list)
+
+def queue(n):
+    '''Solve (all solutions, GAC, mrv) the n-Queens alldiff model with the
+       solver's PropagationQueue and with a ListQueue, and report the
+       nodes explored and the time taken.'''
+    print("{:12} {:>12} {:16} {:>9} {:>10}".format(
+        "problem", "constraints", "queue", "nodes", "time (s)"))
+    csp = csp_problems.nQueens(n, 'alldiff')
+    for queueType in [ListQueue, PropagationQueue]:
+        solver = Solver(csp, 'mrv')
+        solver.queue = queueType()
+        start = time.perf_counter()
+        solver.solve('GAC', True)
+        elapsed = time.perf_counter() - start
+        print("{:12} {:>12} {:16} {:>9} {:>10.3f}".format(
+            "queens-{}".format(n), len(csp.constraintsView()), queueType.__name__,
+            solver.nodesExplored, elapsed))
+
+def domainOps(domainType, size, rounds):
+    '''time the operations on a current domain of size values of type
+       domainType: prune half of the values at random, test the
+       membership of every value, and undo the prunings with a trail'''
+    rng = random.Random(0)
+    var = Variable('x', list(range(size)), domainType)
+    trail = Trail()
+    start = time.perf_counter()
+    for r in range(rounds):
+        trail.newLevel()
+        for code in rng.sample(range(size), size // 2):
+            trail.prune(var, code)
+        for code in range(size):
+            var.inCurDomainCode(code)
+        trail.undoLevel()
+    return time.perf_counter() - start
+
+def domains(n, domainTypes):
+    '''Solve (all solutions, mrv) the n-Queens row model with FC and GAC
+       with the variables using each domainType, then time the basic
+       operations on single domains of growing size (see domainOps). A
+       list scans the domain to find a value, so the other types only pay
+       off once the domains are large.'''
+    print("{:10} {:4} {:8} {:>9} {:>10}".format(
+        "problem", "algo", "domain", "nodes", "time (s)"))
+    for algo in ['FC', 'GAC']:
+        for domainType in domainTypes:
+            solver = Solver(csp_problems.nQueens(n, 'row', domainType), 'mrv')
+            start = time.perf_counter()
+            solver.solve(algo, True)
+            elapsed = time.perf_counter() - start
+            print("{:10} {:4} {:8} {:>9} {:>10.3f}".format(
+                "queens-{}".format(n), algo, domainType, solver.nodesExplored, elapsed))
+    print("")
+    print("{:>8} {:8} {:>10}".format("size", "domain", "time (s)"))
+    for size in [10, 100, 1000, 10000]:
+        for domainType in domainTypes:
+            print("{:>8} {:8} {:>10.3f}".format(
+                size, domainType, domainOps(domainType, size, max(20000 // size, 2))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the CSP solver')
+    parser.add_argument("benchmark", help="which benchmark to run", choices=['allocations', 'construction', 'tables', 'compression', 'alldiff', 'support', 'queue', 'domains'])
+    parser.add_argument("-n", help="the number of queens in the problem", type=int, default=8)
+    parser.add_argument("-a", "--algorithm", help="which backtracking algorithms to use", choices=['BT', 'FC', 'GAC'], nargs='+', default=['FC', 'GAC'])
+    parser.add_argument("-p", "--propagator", help="which table propagators to compare", choices=['support', 'str2', 'ct', 'mdd'], nargs='+', default=['support', 'str2', 'ct', 'mdd'])
+    parser.add_argument("-c", "--consistency", help="which alldiff consistencies to compare", choices=['gac', 'bounds', 'forward'], nargs='+', default=['gac', 'bounds', 'forward'])
+    parser.add_argument("-d", "--domain", help="which domain types to compare", choices=['list', 'bitset', 'sparse'], nargs='+', default=['list', 'bitset', 'sparse'])
+    parser.add_argument("-m", "--model", help="which n-Queens models to use", choices=['row', 'table', 'alldiff'], nargs='+', default=['row', 'table', 'alldiff'])
+    args = parser.parse_args()
+
+    if args.benchmark == 'allocations':
+        allocations(args.n, args.model, args.algorithm)
+    elif args.benchmark == 'construction':
+        construction(args.n, args.model)
+    elif args.benchmark == 'tables':
+        tables(args.n, args.propagator)
+    elif args.benchmark == 'compression':
+        compression(args.n)
+    elif args.benchmark == 'alldiff':
+        alldiff(args.n, args.consistency)
+    elif args.benchmark == 'support':
+        support(args.n, args.model)
+    elif args.benchmark == 'queue':
+        queue(args.n)
+    elif args.benchmark == 'domains':
+        domains(args.n, args.domain)
@@ -1,14 +1,137 @@
 from csp import Constraint, Variable
 import util
+from itertools import groupby
+from operator import itemgetter
+import weakref
+
+class _TupleTable:
+    '''The satisfying tuples of a table constraint with each value
+       replaced by its code (codeTuples, in a list, and tupleSet, a
+       frozenset of the same tuples) and the index of the ids of the
+       tuples containing each value (supports), see TableConstraint.
+       They only depend on the domains of the variables of the scope,
+       not on the variables, and are never modified once built. A table
+       shared between constraints can also hold their satisfying
+       assignments, as a tuple of tuples (assignments, None otherwise).'''
+    __slots__ = ('codeTuples', 'tupleSet', 'supports', 'assignments', '_masks', '_mdd',
+                 '__weakref__')
+
+    def __init__(self, scope, satisfyingAssignments):
+        self.codeTuples = []
+        for assignment in satisfyingAssignments:
+            codes = tuple([v.codeOf(val) for v, val in zip(scope, assignment)])
+            if None not in codes:
+                self.codeTuples.append(codes)
+        self.tupleSet = frozenset(self.codeTuples)
+        self.supports = tuple([[] for c in range(v.domainSize())] for v in scope)
+        for tid, codes in enumerate(self.codeTuples):
+            for i, code in enumerate(codes):
+                self.supports[i][code].append(tid)
+        self.assignments = None
+        self._masks = None    #Compact-Table supports, built on first use
+        self._mdd = None      #built on first use
+
+    def mdd(self):
+        '''return the _MDD compiled from the code tuples (built on first use)'''
+        if self._mdd is None:
+            self._mdd = _MDD(self.codeTuples, len(self.supports))
+        return self._mdd
+
+    def masks(self):
+        '''return, for every position of the scope, the list indexed by code
+           of the bitsets (ints) of the ids of the tuples with that code at
+           that position. Built on first use (by the Compact-Table
+           propagator).'''
+        if self._masks is not None:
+            return self._masks
+        nbytes = (len(self.codeTuples) + 7) // 8
+        masks = []
+        for tidsOfCode in self.supports:
+            bitsets = []
+            for tids in tidsOfCode:
+                bits = bytearray(nbytes)
+                for tid in tids:
+                    bits[tid >> 3] |= 1 << (tid & 7)
+                bitsets.append(int.from_bytes(bits, 'little'))
+            masks.append(bitsets)
+        self._masks = tuple(masks)
+        return self._masks
+
+
+class _MDD:
+    '''A reduced multi-valued decision diagram of a set of code tuples of
+       length arity. Node 0 is the terminal node; every other node has a
+       layer (the position of the scope it branches on) and a tuple of
+       edges (code, child). A tuple is in the set iff following its
+       codes from the root reaches the terminal node. Isomorphic nodes
+       (same layer and same edges) are merged, so tables with a lot of
+       shared structure are stored much more compactly.'''
+    __slots__ = ('arity', 'root', 'edges', 'layer')
+
+    def __init__(self, codeTuples, arity):
+        self.arity = arity
+        self.edges = [()]         #the terminal node has no edges
+        self.layer = [arity]
+        unique = dict()           #(layer, edges) -> node
+
+        def build(tuples, depth):
+            '''return the node of the (sorted) tuples, all sharing their
+               first depth codes'''
+            if depth == arity:
+                return 0
+            edges = tuple([(code, build(list(group), depth + 1))
+                           for code, group in groupby(tuples, key=itemgetter(depth))])
+            node = unique.get((depth, edges))
+            if node is None:
+                node = len(self.edges)
+                self.edges.append(edges)
+                self.layer.append(depth)
+                unique[(depth, edges)] = node
+            return node
+
+        self.root = build(sorted(set(codeTuples)), 0) if codeTuples else None
+
+    def numNodes(self):
+        return len(self.edges)
+
+    def numEdges(self):
+        return sum([len(e) for e in self.edges])
+
 
 class TableConstraint(Constraint):
     '''General type of constraint that can be use to implement any type of
        constraint. But might require a lot of space to do so.
 
        A table constraint explicitly stores the set of satisfying
-       tuples of assignments.'''
+       tuples of assignments.
+
+       GAC can revise a table constraint in several ways, selected with
+       the propagator argument:
+       'support' calls hasSupport for every value of every variable of
+           the scope (each call visits the tuples containing the value),
+       'str2'    uses Simple Tabular Reduction (STR2): the constraint keeps
+           the tuples that are still valid in a reversible sparse set,
+           removes the invalid ones in one sweep and collects the
+           supported values of every variable in the same pass,
+       'ct'      uses Compact-Table: every value has a bitset of the
+           tuples that contain it and the valid tuples are a bitset
+           saved on the trail, so a revision is a few bitwise and/or
+           operations per variable and value,
+       'mdd'     compiles the tuples into a reduced multi-valued decision
+           diagram (see _MDD) and does GAC with a forward and a backward
+           sweep over it. Nodes found unable to reach the terminal node
+           are recorded as dead (reversibly, on the trail) and skipped by
+           the later sweeps,
+       'auto'    (the default) uses 'ct' for tables with at least
+           autoThreshold tuples and 'support' for smaller ones.
+    '''
+    __slots__ = ('satAssignments', '_table', '_propagator',
+                 '_dense', '_limit', '_lastSize', '_current', '_dead', '_deadStack', '_trail')
+    namePrefix = "TableCnstr_"
+    propagators = ['support', 'str2', 'ct', 'mdd', 'auto']
+    autoThreshold = 100   #size from which 'auto' selects 'ct'
 
-    def __init__(self, name, scope, satisfyingAssignments):
+    def __init__(self, name, scope, satisfyingAssignments, propagator='auto'):
         '''Init by specifying a name and a set variables the constraint is over.
            Along with a list of satisfying assignments.
            Each satisfying assignment is itself a list, of length equal to
@@ -31,56 +154,354 @@ class TableConstraint(Constraint):
                                 [4, 2, 3, 1], [4, 3, 1, 2], [4, 3, 2, 1]])
           as these are the only assignments to A,B,C respectively that
           satisfy alldiff(A,B,C,D)
+
+          The satisfying assignments are also stored with each value
+          replaced by its integer code in the domain of its variable (see
+          csp.Variable), which is what check and hasSupport work on. So
+          the constraint must be built after the domains of its variables
+          are set. Assignments using a value that is not in the domain of
+          its variable can never be satisfied and are dropped. check
+          tests the assignment against a frozenset of the code tuples.
+
+          To answer hasSupport without scanning the whole table, the
+          constraint also indexes, for every position i of the scope and
+          every code c of scope[i], the ids (positions in the list of code
+          tuples) of the tuples that have c at position i. The code
+          tuples and their indexes are held in a _TupleTable, which can
+          be shared by constraints with the same table over the same
+          domains (see QueensTableConstraint).
         '''
 
         Constraint.__init__(self,name, scope)
-        self._name = "TableCnstr_" + name
+        self._initTable(satisfyingAssignments, _TupleTable(self._scope, satisfyingAssignments), propagator)
+
+    def _initTable(self, satisfyingAssignments, table, propagator='auto'):
         self.satAssignments = satisfyingAssignments
+        self._table = table
+        self._current = 0
+        self.setPropagator(propagator)
+
+    def tupleTable(self):
+        '''return the _TupleTable holding the code tuples and their indexes
+           (possibly shared with other constraints, must not be modified)'''
+        return self._table
+
+    def propagator(self):
+        '''return the propagator used by GAC (one of 'support', 'str2', 'ct' and 'mdd')'''
+        return self._propagator
+
+    def setPropagator(self, propagator):
+        '''select the propagator used by GAC (see the class docstring).
+           Must not be called during a search.'''
+        if propagator not in TableConstraint.propagators:
+            print("Error TableConstraint given an illegal propagator {}. Must be one of {}".format(
+                propagator, TableConstraint.propagators))
+            propagator = 'auto'
+        if propagator == 'auto':
+            propagator = 'ct' if len(self._table.codeTuples) >= self.autoThreshold else 'support'
+        self._propagator = propagator
+        self._dense = None    #STR2 state, built by reset()
+        self._limit = 0
+        self._lastSize = None
+        self._trail = None
+
+    def reset(self):
+        Constraint.reset(self)
+        self._trail = None    #the trail the state below is saved on, see propagate
+        #_lastSize holds the domain sizes seen by the last propagation
+        self._lastSize = (-1,) * len(self._scope)
+        if self._propagator == 'str2':
+            #all tuples are valid: _dense[:_limit] are the ids of the valid tuples
+            self._dense = list(range(len(self._table.codeTuples)))
+            self._limit = len(self._dense)
+        elif self._propagator == 'ct':
+            #all tuples are valid: bit t of _current is set iff tuple t is valid
+            self._current = (1 << len(self._table.codeTuples)) - 1
+        elif self._propagator == 'mdd':
+            #no dead nodes: _deadStack lists the dead nodes in the order they
+            #were found and _dead holds the same nodes
+            self._dead = set()
+            self._deadStack = []
+
+    def undo(self, state):
+        '''restore the propagator state saved on the trail by propagate'''
+        if self._propagator == 'ct':
+            self._current, self._lastSize = state
+        elif self._propagator == 'mdd':
+            numDead, self._lastSize = state
+            while len(self._deadStack) > numDead:
+                self._dead.discard(self._deadStack.pop())
+        else:
+            self._limit, self._lastSize = state
+
+    def propagate(self, trail):
+        if self._propagator == 'support':
+            return None
+        if trail is not self._trail:
+            #the state was built during another search (or direct call of
+            #GacEnforce), the domains may have changed since
+            self.reset()
+            self._trail = trail
+        if self._propagator == 'str2':
+            return self._str2(trail)
+        if self._propagator == 'ct':
+            return self._compactTable(trail)
+        if self._propagator == 'mdd':
+            return self._mddPropagate(trail)
+        return None
+
+    def _str2(self, trail):
+        '''STR2 propagation (see Lecoutre, "STR2: optimized simple tabular
+           reduction for table constraints", Constraints 16(4), 2011)'''
+        scope = self._scope
+        codeTuples = self._table.codeTuples
+        dense = self._dense
+        lastSize = self._lastSize
+
+        #only the variables whose domains changed since the last sweep can
+        #invalidate a tuple, and only the unassigned ones can lose values
+        sizes = tuple([v.curDomainSize() for v in scope])
+        sVal = [i for i, v in enumerate(scope) if sizes[i] != lastSize[i]]
+        sSup = [i for i, v in enumerate(scope) if not v.isAssigned()]
+        supported = [set() for i in scope]
+
+        limit = self._limit
+        i = 0
+        while i < limit:
+            t = codeTuples[dense[i]]
+            self._checks += 1
+            for p in sVal:
+                if not scope[p].inCurDomainCode(t[p]):
+                    #invalid, swap it out of the valid part of the set
+                    limit -= 1
+                    dense[i], dense[limit] = dense[limit], dense[i]
+                    break
+            else:
+                for p in sSup:
+                    supported[p].add(t[p])
+                #stop collecting for variables whose values are all supported
+                sSup = [p for p in sSup if len(supported[p]) < sizes[p]]
+                i += 1
+
+        pruned = []
+        if limit > 0:
+            for p in sSup:
+                var = scope[p]
+                for code in var.curDomainCodes():
+                    if code not in supported[p]:
+                        trail.prune(var, code)
+                if not var in pruned:
+                    pruned.append(var)
+
+        #all remaining tuples are valid for the domains as they are now
+        sizes = tuple([v.curDomainSize() for v in scope])
+        if limit != self._limit or sizes != lastSize:
+            trail.save(self, (self._limit, lastSize))
+            self._limit = limit
+            self._lastSize = sizes
+        if limit == 0 or 0 in sizes:
+            return "DWO"
+        return pruned
+
+    def _compactTable(self, trail):
+        '''Compact-Table propagation (see Demeulenaere et al., "Compact-Table:
+           efficiently filtering table constraints with reversible sparse
+           bit-sets", CP 2016), with the bitsets held in Python ints'''
+        scope = self._scope
+        masks = self._table.masks()
+        lastSize = self._lastSize
+
+        #remove the tuples made invalid by the variables whose domains
+        #changed since the last propagation
+        sizes = tuple([v.curDomainSize() for v in scope])
+        current = self._current
+        for p, var in enumerate(scope):
+            if sizes[p] != lastSize[p]:
+                self._checks += 1
+                if var.isAssigned():
+                    current &= masks[p][var.getCode()]
+                else:
+                    valid = 0
+                    for code in var.curDomainCodes():
+                        valid |= masks[p][code]
+                    current &= valid
+                if current == 0:
+                    break
+
+        #a value is supported iff one of its tuples is still valid. If no
+        #tuple was removed every value is still supported (except on the
+        #first propagation, when some values may have no tuples at all).
+        pruned = []
+        if current != 0 and (current != self._current or -1 in lastSize):
+            for p, var in enumerate(scope):
+                if var.isAssigned():
+                    continue
+                for code in var.curDomainCodes():
+                    self._checks += 1
+                    if not current & masks[p][code]:
+                        trail.prune(var, code)
+                        if not var in pruned:
+                            pruned.append(var)
+
+        sizes = tuple([v.curDomainSize() for v in scope])
+        if current != self._current or sizes != lastSize:
+            trail.save(self, (self._current, lastSize))
+            self._current = current
+            self._lastSize = sizes
+        if current == 0 or 0 in sizes:
+            return "DWO"
+        return pruned
+
+    def _mddPropagate(self, trail):
+        '''GAC on the MDD of the table (in the spirit of Cheng and Yap,
+           "An MDD-based generalized arc consistency algorithm for positive
+           and negative table constraints and some global constraints",
+           Constraints 15(2), 2010)'''
+        scope = self._scope
+        mdd = self._table.mdd()
+        lastSize = self._lastSize
+        if mdd.root is None or mdd.root in self._dead:
+            return "DWO"  #empty table, or wiped out by an earlier sweep
+        sizes = tuple([v.curDomainSize() for v in scope])
+        if sizes == lastSize:
+            return []     #nothing changed since the last sweep
+        edges = mdd.edges
+        dead = self._dead
+        numDead = len(self._deadStack)
+
+        #forward: the nodes reachable from the root with the current domains
+        reached = [[mdd.root]]
+        for depth in range(mdd.arity - 1):
+            var = scope[depth]
+            nextLayer = set()
+            for node in reached[depth]:
+                for code, child in edges[node]:
+                    self._checks += 1
+                    if child not in dead and var.inCurDomainCode(code):
+                        nextLayer.add(child)
+            reached.append(list(nextLayer))
+
+        #backward: the reached nodes that can still reach the terminal node,
+        #collecting the codes on their edges. The others are now dead.
+        supported = [set() for v in scope]
+        alive = set([0])
+        for depth in range(mdd.arity - 1, -1, -1):
+            var = scope[depth]
+            layerAlive = set()
+            for node in reached[depth]:
+                for code, child in edges[node]:
+                    if child in alive and var.inCurDomainCode(code):
+                        supported[depth].add(code)
+                        layerAlive.add(node)
+                if node not in layerAlive and node not in dead:
+                    dead.add(node)
+                    self._deadStack.append(node)
+            alive = layerAlive
+
+        pruned = []
+        if alive:
+            for p, var in enumerate(scope):
+                if var.isAssigned():
+                    continue
+                for code in var.curDomainCodes():
+                    if code not in supported[p]:
+                        trail.prune(var, code)
+                        if not var in pruned:
+                            pruned.append(var)
+
+        trail.save(self, (numDead, lastSize))
+        self._lastSize = tuple([v.curDomainSize() for v in scope])
+        if not alive or 0 in self._lastSize:
+            return "DWO"
+        return pruned
 
     def check(self):
         '''check if current variable assignments are in the satisfying set'''
         assignments = []
-        for v in self.scope():
+        for v in self._scope:
             if v.isAssigned():
-                assignments.append(v.getValue())
+                assignments.append(v.getCode())
             else:
                 return True
-        return assignments in self.satAssignments
+        return tuple(assignments) in self._table.tupleSet
+
+    def revise(self, var):
+        '''if var is the only unassigned variable of the scope (as in FC),
+           look up each of its values, with the assigned values of the
+           other variables, in the set of tuples. Otherwise use the
+           support index (see hasSupportCode).'''
+        if self.numUnassigned() == 1 and not var.isAssigned():
+            assignment = [v.getCode() for v in self._scope]
+            vindex = self._scope.index(var)
+            tupleSet = self._table.tupleSet
+            unsupported = []
+            for code in var.curDomainCodes():
+                assignment[vindex] = code
+                if not tuple(assignment) in tupleSet:
+                    unsupported.append(code)
+            return unsupported
+        return [code for code in var.curDomainCodes() if not self.hasSupportCode(var, code)]
 
     def hasSupport(self, var,val):
         '''check if var=val has an extension to an assignment of all variables in
            constraint's scope that satisfies the constraint. Important only to
            examine values in the variable's current domain as possible extensions'''
-        if var not in self.scope():
+        if var not in self._scope:
             return True   #var=val has support on any constraint it does not participate in
-        vindex = self.scope().index(var)
+        code = var.codeOf(val)
+        if code is None:
+            return False  #val is not in var's domain so no assignment can make var=val
+        return self.hasSupportCode(var, code)
+
+    def hasSupportCode(self, var, code):
+        '''hasSupport for the value of var with integer code code'''
+        scope = self._scope
+        if var not in scope:
+            return True   #var=val has support on any constraint it does not participate in
+        vindex = scope.index(var)
+        table = self._table
+        codeTuples = table.codeTuples
+        residues = self.residues()
+        key = (vindex, code)
+        tid = residues.get(key)
+        if tid is not None:
+            assignment = codeTuples[tid]
+            for i, v in enumerate(scope):
+                if i != vindex and not v.inCurDomainCode(assignment[i]):
+                    break
+            else:
+                return True   #the last support found is still valid
         found = False
-        for assignment in self.satAssignments:
-            if assignment[vindex] != val:
-                continue   #this assignment can't work it doesn't make var=val
-            found = True   #Otherwise it has potential. Assume found until shown otherwise
-            for i, v in enumerate(self.scope()):
-                if i != vindex and not v.inCurDomain(assignment[i]):
+        #only visit the assignments that make var=val
+        for tid in table.supports[vindex][code]:
+            assignment = codeTuples[tid]
+            self._checks += 1
+            found = True   #Assume found until shown otherwise
+            for i, v in enumerate(scope):
+                if i != vindex and not v.inCurDomainCode(assignment[i]):
                     found = False  #Bummer...this assignment didn't work it assigns
                     break          #a value to v that is not in v's curDomain
                                    #note we skip checking if val in in var's curDomain
             if found:     #if found still true the assigment worked. We can stop
+                residues[key] = tid
                 break
         return found     #either way found has the right truth value
 
 
 class QueensConstraint(Constraint):
     '''Queens constraint between queen in row i and row j'''
+    __slots__ = ('i', 'j')
+    namePrefix = "QueenCnstr_"
+
     def __init__(self, name, qi, qj, i, j):
         scope = [qi, qj]
         Constraint.__init__(self,name, scope)
-        self._name = "QueenCnstr_" + name
         self.i = i
         self.j = j
 
     def check(self):
-        qi = self.scope()[0]
-        qj = self.scope()[1]
+        qi = self._scope[0]
+        qj = self._scope[1]
         if not qi.isAssigned() or not qj.isAssigned():
             return True
         return self.queensCheck(qi.getValue(),qj.getValue())
@@ -93,15 +514,23 @@ class QueensConstraint(Constraint):
            other variable in the constraint that satisfies the constraint'''
         #hasSupport for this constraint is easier as we only have one
         #other variable in the constraint.
-        if var not in self.scope():
+        if var not in self._scope:
             return True   #var=val has support on any constraint it does not participate in
-        otherVar = self.scope()[0]
+        otherVar = self._scope[0]
         if otherVar == var:
-            otherVar = self.scope()[1]
-        for otherVal in otherVar.curDomain():
-            if self.queensCheck(val, otherVal):
-                return True
-        return False
+            otherVar = self._scope[1]
+        #val is supported iff the other queen has a position outside the
+        #column and the two diagonals of val
+        d = abs(self.i - self.j)
+        self._checks += 1
+        return _hasValueOutside(otherVar, (val, val - d, val + d))
+
+    def revise(self, var):
+        if var not in self._scope:
+            return []
+        d = abs(self.i - self.j)
+        return _reviseOutside(var, _otherVar(self._scope, var), self,
+                              lambda val, otherVal: otherVal != val and abs(otherVal - val) != d, 3)
 
 class QueensTableConstraint(TableConstraint):
     '''Queens constraint between queen in row i and row j, but
@@ -119,37 +548,61 @@ class QueensTableConstraint(TableConstraint):
     #inside of this class body. You must not change
     #the existing function signatures.
     # "Creates a table constraint to capture the queens table constraint" 
+    #
+    # The table only depends on |i-j| and the domains of the two queens,
+    # so each distinct table is built once and shared (the _TupleTable,
+    # holding the satisfying assignments as a tuple of tuples) by all
+    # constraints with the same signature, see _queensTables.
+    __slots__ = ('i', 'j')
 
     def __init__(self, name, qi, qj, i, j):
-        self._name = "Queen_" + name
         self.i = i
         self.j = j
-        allowablePos = []
+        key = (abs(i - j), qi.domainView(), qj.domainView())
+        Constraint.__init__(self, name, [qi, qj])
+        table = _queensTables.get(key)
+        if table is None:
+            allowablePos = []
+
+            # Looping through qi domain:
+            for qiElement in qi.domainView():
 
-        # Looping through qi domain:
-        for qiElement in qi.domain():
-               
-            # Lopping through qj domain:
-            for qjElement in qj.domain():
-                if abs(qiElement - qjElement) != abs(self.i - self.j):
-                    if qiElement != qjElement:
-                        allowablePos.append([qiElement, qjElement])
+                # Lopping through qj domain:
+                for qjElement in qj.domainView():
+                    if abs(qiElement - qjElement) != abs(self.i - self.j):
+                        if qiElement != qjElement:
+                            allowablePos.append((qiElement, qjElement))
 
-        TableConstraint.__init__(self, name,  [qi, qj], allowablePos)
+            table = _TupleTable(self._scope, allowablePos)
+            table.assignments = tuple(allowablePos)
+            _queensTables[key] = table
+        self._initTable(table.assignments, table)
+
+#the tables of the QueensTableConstraints, keyed by (|i-j|, domain of qi,
+#domain of qj). A table is only kept while some constraint uses it.
+_queensTables = weakref.WeakValueDictionary()
+
+def clearTableCaches():
+    '''forget the tables shared between the constraints built so far, so
+       that the next constraints build new ones. The constraints already
+       built keep theirs.'''
+    _queensTables.clear()
 
 
 class NeqConstraint(Constraint):
     '''Neq constraint between two variables'''
+    __slots__ = ('_abs_diff',)
+    namePrefix = "NeqCnstr_"
+
     def __init__(self, name, scope, i, j):
         if len(scope) != 2:
             print("Error Neq Constraints are only between two variables")
         Constraint.__init__(self,name, scope)
-        self._name = "NeqCnstr_" + name
         self._abs_diff = abs(i - j)
 
     def check(self):
-        v0 = self.scope()[0]
-        v1 = self.scope()[1]
+        v0 = self._scope[0]
+        v1 = self._scope[1]
         if not v0.isAssigned() or not v1.isAssigned():
             return True
         return self._abs_diff != abs(v0.getValue() - v1.getValue())
@@ -159,27 +612,105 @@ class NeqConstraint(Constraint):
            other variable in the constraint that satisfies the constraint'''
         #hasSupport for this constraint is easier than AllDiff as we only have one
         #other variable in the constraint.
-        if var not in self.scope():
+        if var not in self._scope:
             return True   #var=val has support on any constraint it does not participate in
-        otherVar = self.scope()[0]
+        otherVar = self._scope[0]
         if otherVar == var:
-            otherVar = self.scope()[1]
-        
-        def notEqual(l):
-            return self._abs_diff != abs(l[0][1] - l[1][1])
+            otherVar = self._scope[1]
+
+        #val is supported iff the other variable has a value that is not
+        #at distance _abs_diff from it
+        d = self._abs_diff
+        self._checks += 1
+        return _hasValueOutside(otherVar, (val - d, val + d) if d else (val,))
+
+    def revise(self, var):
+        if var not in self._scope:
+            return []
+        d = self._abs_diff
+        return _reviseOutside(var, _otherVar(self._scope, var), self,
+                              lambda val, otherVal: abs(otherVal - val) != d, 2 if d else 1)
+
+
+def _otherVar(scope, var):
+    '''the variable of a binary constraint's scope that is not var'''
+    return scope[1] if scope[0] is var else scope[0]
+
+def _reviseOutside(var, otherVar, cnstr, compatible, numForbidden):
+    '''revise for a binary constraint that forbids at most numForbidden
+       values of otherVar for each value of var: nothing to prune unless
+       otherVar has at most numForbidden values, and then only those need
+       to be compared (with compatible(val, otherVal))'''
+    if otherVar.curDomainSize() > numForbidden:
+        return []
+    otherVals = list(otherVar.curDomainView())
+    unsupported = []
+    for code in var.curDomainCodes():
+        cnstr._checks += 1
+        val = var.valueOf(code)
+        for otherVal in otherVals:
+            if compatible(val, otherVal):
+                break
+        else:
+            unsupported.append(code)
+    return unsupported
+
+def _hasValueOutside(var, forbidden):
+    '''return True iff the current domain of var has a value that is not
+       in forbidden (a few distinct values). Unless the domain is smaller
+       than forbidden, the answer is known from the size of the domain.'''
+    size = var.curDomainSize()
+    if size > len(forbidden):
+        return True
+    for val in forbidden:
+        if var.inCurDomain(val):
+            size -= 1
+    return size > 0
 
-        return findvals([otherVar], [(var, val)], notEqual, notEqual)
 
 
 class AllDiffConstraint(Constraint):
-    '''All diff constraint between a set of variables'''
-    def __init__(self, name, scope):
+    '''All diff constraint between a set of variables
+
+       The GAC search propagates the whole constraint at once with
+       propagate rather than value by value with hasSupport. How much
+       it prunes is selected with the consistency argument:
+       'gac'     (the default) prunes every value that is in no solution
+           of the constraint (Regin's algorithm). The maximum matching of
+           the variables to values that it computes is kept between calls
+           and repaired, rather than recomputed, when some of its values
+           are pruned. On two variables it is the same as 'forward'.
+       'bounds'  only narrows the bounds of the domains (Lopez-Ortiz et
+           al.'s O(n log n) algorithm). The values must be integers. The
+           bounds of 'interval' variables are moved in one step (see
+           backtracking.Trail.pruneBounds) without visiting their values.
+       'forward' removes the value of every variable whose domain is a
+           single value (e.g., assigned) from the other domains.
+    '''
+    __slots__ = ('_consistency', '_match')
+    namePrefix = "AllDiff_"
+    consistencies = ['gac', 'bounds', 'forward']
+
+    def __init__(self, name, scope, consistency='gac'):
         Constraint.__init__(self,name, scope)
-        self._name = "AllDiff_" + name
+        self._match = [None] * len(self._scope)   #value matched to each position
+        self.setConsistency(consistency)
+
+    def consistency(self):
+        return self._consistency
+
+    def setConsistency(self, consistency):
+        '''select the consistency enforced by propagate (see the class
+           docstring). Must not be called during a search.'''
+        if consistency not in AllDiffConstraint.consistencies:
+            print("Error AllDiffConstraint given an illegal consistency {}. Must be one of {}".format(
+                consistency, AllDiffConstraint.consistencies))
+            consistency = 'gac'
+        self._consistency = consistency
 
     def check(self):
         assignments = []
-        for v in self.scope():
+        for v in self._scope:
             if v.isAssigned():
                 assignments.append(v.getValue())
             else:
@@ -189,9 +720,19 @@ class AllDiffConstraint(Constraint):
     def hasSupport(self, var, val):
         '''check if var=val has an extension to an assignment of the
            other variable in the constraint that satisfies the constraint'''
-        if var not in self.scope():
+        if var not in self._scope:
             return True   #var=val has support on any constraint it does not participate in
 
+        residues = self.residues()
+        key = (var, val)
+        residue = residues.get(key)
+        if residue is not None:
+            for v, otherVal in residue:
+                if not v.inCurDomain(otherVal):
+                    break
+            else:
+                return True   #the last support found is still valid
+
         #since the constraint has many variables use the helper function 'findvals'
         #for that we need two test functions
         #1. for testing complete assignments to the constraint's scope
@@ -208,13 +749,336 @@ class AllDiffConstraint(Constraint):
         def valsNotEqual(l):
             '''tests a list of assignments which are pairs (var,val)
                to see if they can satisfy the all diff'''
+            self._checks += 1
             vals = [val for (var, val) in l]
             return len(set(vals)) == len(vals)
-        varsToAssign = self.scope()
-        varsToAssign.remove(var)
-        x = findvals(varsToAssign, [(var, val)], valsNotEqual, valsNotEqual)
+        varsToAssign = [v for v in self._scope if v is not var]
+        #when findvals succeeds assignment holds the support it found
+        assignment = [(var, val)]
+        x = findvals(varsToAssign, assignment, valsNotEqual, valsNotEqual)
+        if x:
+            residues[key] = tuple(assignment[1:])
         return x
 
+    def reset(self):
+        Constraint.reset(self)
+        self._match = [None] * len(self._scope)
+
+    def propagate(self, trail):
+        if self._consistency == 'bounds':
+            return self._bounds(trail)
+        if self._consistency == 'forward' or len(self._scope) <= 2:
+            return self._forward(trail)
+        return self._regin(trail)
+
+    def _forward(self, trail):
+        '''remove the values of the variables with a single value from the
+           domains of the other variables, until no more variables are
+           left with a single value'''
+        scope = self._scope
+        pruned = []
+        done = set()      #positions whose value has been removed from the others
+        changed = True
+        while changed:
+            changed = False
+            for p, var in enumerate(scope):
+                if p in done or var.curDomainSize() != 1:
+                    continue
+                done.add(p)
+                changed = True
+                val = next(iter(var.curDomainView()))
+                for q, other in enumerate(scope):
+                    if q == p:
+                        continue
+                    self._checks += 1
+                    if other.isAssigned():
+                        if other.getValue() == val:
+                            return "DWO"
+                    elif other.inCurDomain(val):
+                        trail.prune(other, other.codeOf(val))
+                        if other.curDomainSize() == 0:
+                            return "DWO"
+                        if not other in pruned:
+                            pruned.append(other)
+        return pruned
+
+    def _bounds(self, trail):
+        '''bounds consistency (Lopez-Ortiz, Quimper, Tromp and van Beek, "A
+           fast and simple algorithm for bounds consistency of the
+           alldifferent constraint", IJCAI 2003)'''
+        scope = self._scope
+        n = len(scope)
+        for v in scope:
+            if v.curDomainSize() == 0:
+                return "DWO"
+        lo = [v.curMin() for v in scope]
+        hi = [v.curMax() for v in scope]
+        self._checks += n
+        newLo = _boundsFilter(lo, hi)
+        if newLo is None:
+            return "DWO"
+        #the upper bounds are the lower bounds of the negated intervals
+        newHi = _boundsFilter([-h for h in hi], [-l for l in lo])
+        if newHi is None:
+            return "DWO"
+
+        pruned = []
+        for p, var in enumerate(scope):
+            low, high = newLo[p], -newHi[p]
+            if var.isAssigned() or (low == lo[p] and high == hi[p]):
+                continue
+            #one step for interval domains, whatever their size
+            trail.pruneBounds(var, low, high)
+            if var.curDomainSize() == 0:
+                return "DWO"
+            pruned.append(var)
+        return pruned
+
+    def _regin(self, trail):
+        unsupported = self._unsupported()
+        if unsupported is None:
+            return "DWO"
+        pruned = []
+        for p, vals in enumerate(unsupported):
+            var = self._scope[p]
+            if vals and not var.isAssigned():
+                for val in vals:
+                    trail.prune(var, var.codeOf(val))
+                if not var in pruned:
+                    pruned.append(var)
+        return pruned
+
+    def _unsupported(self):
+        '''Regin's GAC algorithm for alldiff ("A filtering algorithm for
+           constraints of difference in CSPs", AAAI 1994): a value is
+           supported iff its edge is in some maximum matching of the
+           variables to their values. Return the list of the unsupported
+           values of each position, or None if the constraint has no
+           solution.'''
+        scope = self._scope
+        n = len(scope)
+        domains = [list(v.curDomainView()) for v in scope]
+        self._checks += sum([len(d) for d in domains])
+
+        #repair the matching kept from the last call: drop the values no
+        #longer in their domains, then augment from the unmatched variables
+        match = self._match
+        owner = dict()    #value -> position it is matched to
+        for p in range(n):
+            val = match[p]
+            if val is not None and val not in owner and scope[p].inCurDomain(val):
+                owner[val] = p
+            else:
+                match[p] = None
+        for p in range(n):
+            if match[p] is None and not self._augment(p, domains, match, owner):
+                return None   #fewer values than variables
+
+        #orient the edges: variable -> matched value, value -> variable for
+        #the other edges. Variables are nodes 0..n-1, values n, n+1, ...
+        valueNode = dict()
+        for d in domains:
+            for val in d:
+                if val not in valueNode:
+                    valueNode[val] = n + len(valueNode)
+        graph = [[] for i in range(n + len(valueNode))]
+        for p in range(n):
+            graph[p].append(valueNode[match[p]])
+            for val in domains[p]:
+                if val != match[p]:
+                    graph[valueNode[val]].append(p)
+
+        #an edge not in the matching is in some maximum matching iff it is
+        #on an alternating cycle (both ends in the same strongly connected
+        #component) or on an alternating path from a free (unmatched) value
+        component = _stronglyConnectedComponents(graph)
+        free = [node for val, node in valueNode.items() if val not in owner]
+        reachable = set(free)
+        stack = list(free)
+        while stack:
+            for nxt in graph[stack.pop()]:
+                if nxt not in reachable:
+                    reachable.add(nxt)
+                    stack.append(nxt)
+
+        unsupported = []
+        for p in range(n):
+            unsupported.append([val for val in domains[p] if val != match[p] and
+                                component[valueNode[val]] != component[p] and
+                                valueNode[val] not in reachable])
+        return unsupported
+
+    def revise(self, var):
+        if var not in self._scope:
+            return []
+        if len(self._scope) <= 2:
+            #only the value of a single valued other variable is unsupported
+            other = [v for v in self._scope if v is not var]
+            if not other or other[0].curDomainSize() != 1:
+                return []
+            val = next(iter(other[0].curDomainView()))
+            return [var.codeOf(val)] if var.inCurDomain(val) else []
+        unsupported = self._unsupported()
+        if unsupported is None:
+            return var.curDomainCodes()
+        return [var.codeOf(val) for val in unsupported[self._scope.index(var)]]
+
+    def _augment(self, p, domains, match, owner):
+        '''find an augmenting path from the unmatched position p and flip
+           it. Return False if there is none.'''
+        #iterative depth first search over alternating paths
+        parent = {}       #value -> position it was reached from
+        stack = [(p, iter(domains[p]))]
+        while stack:
+            q, vals = stack[-1]
+            for val in vals:
+                if val in parent:
+                    continue
+                parent[val] = q
+                r = owner.get(val)
+                if r is None:
+                    #free value, flip the path back to p
+                    while True:
+                        q = parent[val]
+                        prev = match[q]
+                        match[q] = val
+                        owner[val] = q
+                        if q == p:
+                            return True
+                        val = prev
+                stack.append((r, iter(domains[r])))
+                break
+            else:
+                stack.pop()
+        return False
+
+
+def _boundsFilter(lo, hi):
+    '''The lower bound pass of the bounds consistency algorithm for
+       alldiff (see AllDiffConstraint._bounds) on the integer intervals
+       [lo[i], hi[i]]. Return the new lower bounds, or None if the
+       intervals have no system of distinct representatives.'''
+    n = len(lo)
+    minSorted = sorted(range(n), key=lambda i: lo[i])
+    maxSorted = sorted(range(n), key=lambda i: hi[i])
+
+    #the distinct values of the lo[i] and hi[i]+1, with sentinels at both
+    #ends, and the rank in it of the bounds of each interval
+    minRank = [0] * n
+    maxRank = [0] * n
+    bounds = [lo[minSorted[0]] - 2]
+    i = j = 0
+    nextMin = lo[minSorted[0]]
+    nextMax = hi[maxSorted[0]] + 1
+    while True:
+        if i < n and nextMin <= nextMax:
+            if nextMin != bounds[-1]:
+                bounds.append(nextMin)
+            minRank[minSorted[i]] = len(bounds) - 1
+            i += 1
+            if i < n:
+                nextMin = lo[minSorted[i]]
+        else:
+            if nextMax != bounds[-1]:
+                bounds.append(nextMax)
+            maxRank[maxSorted[j]] = len(bounds) - 1
+            j += 1
+            if j == n:
+                break
+            nextMax = hi[maxSorted[j]] + 1
+    bounds.append(bounds[-1] + 2)
+    nb = len(bounds) - 2
+
+    def pathMax(a, x):
+        while x < a[x]:
+            x = a[x]
+        return x
+
+    def pathSet(a, x, y, z):
+        while x != y:
+            nxt = a[x]
+            a[x] = z
+            x = nxt
+
+    t = [0] * (nb + 2)     #tree links
+    d = [0] * (nb + 2)     #capacities
+    h = [0] * (nb + 2)     #Hall interval links
+    for k in range(1, nb + 2):
+        t[k] = h[k] = k - 1
+        d[k] = bounds[k] - bounds[k - 1]
+    newLo = list(lo)
+    for i in maxSorted:
+        x = minRank[i]
+        y = maxRank[i]
+        z = pathMax(t, x + 1)
+        j = t[z]
+        d[z] -= 1
+        if d[z] == 0:
+            t[z] = z + 1
+            z = pathMax(t, t[z])
+            t[z] = j
+        pathSet(t, x + 1, z, z)
+        if d[z] < bounds[z] - bounds[y]:
+            return None    #more intervals than values
+        if h[x] > x:
+            w = pathMax(h, h[x])
+            newLo[i] = bounds[w]
+            pathSet(h, x, w, w)
+        if d[z] == bounds[z] - bounds[y]:
+            pathSet(h, h[y], j - 1, y)   #found a Hall interval
+            h[y] = j - 1
+    return newLo
+
+
+def _stronglyConnectedComponents(graph):
+    '''Tarjan's algorithm on a graph given as adjacency lists over the
+       nodes 0..len(graph)-1. Return the list of the component number of
+       each node.'''
+    index = [None] * len(graph)
+    low = [0] * len(graph)
+    component = [None] * len(graph)
+    stack = []
+    onStack = [False] * len(graph)
+    counter = 0
+    numComponents = 0
+    for start in range(len(graph)):
+        if index[start] is not None:
+            continue
+        work = [(start, 0)]
+        while work:
+            node, i = work.pop()
+            if i == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                onStack[node] = True
+            recurse = False
+            edges = graph[node]
+            while i < len(edges):
+                nxt = edges[i]
+                i += 1
+                if index[nxt] is None:
+                    work.append((node, i))
+                    work.append((nxt, 0))
+                    recurse = True
+                    break
+                elif onStack[nxt]:
+                    low[node] = min(low[node], index[nxt])
+            if recurse:
+                continue
+            if low[node] == index[node]:
+                while True:
+                    w = stack.pop()
+                    onStack[w] = False
+                    component[w] = numComponents
+                    if w == node:
+                        break
+                numComponents += 1
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+    return component
+
 
 def findvals(remainingVars, assignment, finalTestfn, partialTestfn=lambda x: True):
     '''Helper function for finding an assignment to the variables of a constraint
@@ -247,7 +1111,7 @@ def findvals_(remainingVars, assignment, finalTestfn, partialTestfn):
     if len(remainingVars) == 0:
         return finalTestfn(assignment)
     var = remainingVars.pop()
-    for val in var.curDomain():
+    for val in var.curDomainView():
         assignment.append((var, val))
         if partialTestfn(assignment):
             if findvals_(remainingVars, assignment, finalTestfn, partialTestfn):
@@ -271,24 +1135,37 @@ class NValuesConstraint(Constraint):
        the V1, V2, V3, V4 are assigned the value 3 or 2, and at most 3
        of them have been assigned the value 3 or 2.
 
+       GAC is enforced by counting (see propagate): each variable must,
+       may or cannot take a required value, depending on its current
+       domain. The status of each variable and the counts are kept
+       between calls (saved on the trail), so a call only looks at the
+       variables whose domains changed since the last one.
     '''
 
     #Question 5 you have to complete the implementation of
     #check() and hasSupport. You can change __init__ if you want
     #but do not change its parameters.
+    __slots__ = ('_lb', '_ub', '_required', '_requiredSet',
+                 '_status', '_numMust', '_numMay', '_lastSize', '_trail')
+    namePrefix = "NValues_"
+
+    #status of a variable
+    CANNOT, MAY, MUST = 0, 1, 2
+
     def __init__(self, name, scope, required_values, lower_bound, upper_bound):
         Constraint.__init__(self,name, scope)
         self._lb = lower_bound
         self._ub = upper_bound
-        self._name = "NValues_" + name
         self._required = required_values
+        self._requiredSet = frozenset(required_values)
+        self._status = None    #built by the first propagate
 
     def check(self):
         # Initializing:
         assignedList = []
 
         # Looping through scope for variables:
-        for variable in self.scope():
+        for variable in self._scope:
             if variable.isAssigned():
                 if variable.getValue() in self._required:
                     assignedList.append(variable.getValue())
@@ -315,7 +1192,7 @@ class NValuesConstraint(Constraint):
            x = findvals(varsToAssign, [(var, val)], valsNotEqual, valsNotEqual)
            return x'''
 
-        if var not in self.scope():
+        if var not in self._scope:
             return True
 
         def testValue(list):   
@@ -327,8 +1204,347 @@ class NValuesConstraint(Constraint):
 
             return (len(assignedList) >= self._lb) and (len(assignedList) <= self._ub)
         
-        variables = self.scope()
-        variables.remove(var)
+        variables = [v for v in self._scope if v is not var]
         
         return findvals(variables, [(var, val)], testValue)
 
+    def reset(self):
+        Constraint.reset(self)
+        self._status = None
+        self._trail = None    #the trail the counts are saved on, see propagate
+
+    def revise(self, var):
+        '''a required value of var is supported iff, with m the number of
+           the other variables that must take a required value and k the
+           number that may, m + 1 <= ub and m + 1 + k >= lb. Any other
+           value iff m <= ub and m + k >= lb.'''
+        if var not in self._scope:
+            return []
+        counts = [0, 0, 0]
+        for v in self._scope:
+            if v is not var:
+                counts[self._classify(v)] += 1
+        numMust, numMay = counts[NValuesConstraint.MUST], counts[NValuesConstraint.MAY]
+        requiredOk = numMust + 1 <= self._ub and numMust + 1 + numMay >= self._lb
+        otherOk = numMust <= self._ub and numMust + numMay >= self._lb
+        return [code for code in var.curDomainCodes()
+                if not (requiredOk if var.valueOf(code) in self._requiredSet else otherOk)]
+
+    def undo(self, state):
+        '''restore the counts saved on the trail by propagate'''
+        self._status, self._numMust, self._numMay, self._lastSize = state
+
+    def _classify(self, var):
+        '''return the status of var: MUST if every value in its current
+           domain is required, CANNOT if none is, MAY otherwise'''
+        required = self._requiredSet
+        hasRequired = hasOther = False
+        for val in var.curDomainView():
+            self._checks += 1
+            if val in required:
+                hasRequired = True
+            else:
+                hasOther = True
+            if hasRequired and hasOther:
+                return NValuesConstraint.MAY
+        return NValuesConstraint.MUST if hasRequired else NValuesConstraint.CANNOT
+
+    def propagate(self, trail):
+        '''With m variables that must take a required value and k that may,
+           the constraint has a solution iff m <= ub and m + k >= lb. A
+           required value of a MAY variable is supported iff m + 1 <= ub
+           and any other value iff m + k - 1 >= lb, the values of the other
+           variables always are.'''
+        scope = self._scope
+        if trail is not self._trail:
+            #the counts were built during another search (or direct call of
+            #GacEnforce), the domains may have changed since
+            self._status = None
+            self._trail = trail
+        if self._status is None:
+            self._status = (None,) * len(scope)
+            self._numMust = self._numMay = 0
+            self._lastSize = (-1,) * len(scope)
+        state = (self._status, self._numMust, self._numMay, self._lastSize)
+        status = list(self._status)
+        counts = [0, self._numMay, self._numMust]   #indexed by status
+
+        def update(positions):
+            for p in positions:
+                new = self._classify(scope[p])
+                if status[p] is not None:
+                    counts[status[p]] -= 1
+                counts[new] += 1
+                status[p] = new
+
+        lastSize = self._lastSize
+        update([p for p, v in enumerate(scope) if v.curDomainSize() != lastSize[p]])
+
+        pruned = []
+        numMust, numMay = counts[NValuesConstraint.MUST], counts[NValuesConstraint.MAY]
+        dwo = numMust > self._ub or numMust + numMay < self._lb
+        if not dwo and numMay > 0 and (numMust == self._ub or numMust + numMay == self._lb):
+            #the MAY variables must all avoid (or all take) a required value
+            keepRequired = numMust != self._ub
+            mayPositions = [p for p in range(len(scope)) if status[p] == NValuesConstraint.MAY]
+            for p in mayPositions:
+                var = scope[p]
+                for val in list(var.curDomainView()):
+                    if (val in self._requiredSet) != keepRequired and var.inCurDomain(val):
+                        trail.prune(var, var.codeOf(val))
+                if not var in pruned:
+                    pruned.append(var)
+            update(mayPositions)
+
+        self._status = tuple(status)
+        self._numMust, self._numMay = counts[NValuesConstraint.MUST], counts[NValuesConstraint.MAY]
+        self._lastSize = tuple([v.curDomainSize() for v in scope])
+        if state[1:] != (self._numMust, self._numMay, self._lastSize) or state[0] != self._status:
+            trail.save(self, state)
+        if dwo:
+            return "DWO"
+        return pruned
+
+
+class GlobalCardinalityConstraint(Constraint):
+    '''Global cardinality constraint over a set of variables. For every
+       i, the number of variables of the scope assigned the value
+       values[i] is in the range [lower_bounds[i], upper_bounds[i]].
+       Values that are not in values can be used any number of times.
+
+       For example, with 4 variables V1, V2, V3, V4, each with domain
+       [1, 2, 3], the call
+       GlobalCardinalityConstraint('test_gcc', [V1, V2, V3, V4], [1, 2], [1, 0], [2, 1])
+       is satisfied by the assignments that use 1 once or twice and 2 at
+       most once. This is the same as stacking
+       NValuesConstraint('1', [V1, V2, V3, V4], [1], 1, 2) and
+       NValuesConstraint('2', [V1, V2, V3, V4], [2], 0, 1) but propagates
+       much more.
+
+       The consistency argument selects what propagate enforces:
+       'gac'   (the default) prunes every value that is in no solution of
+           the constraint, with Regin's flow based algorithm ("Generalized
+           arc consistency for global cardinality constraint", AAAI 1996).
+           The flow (an assignment of the variables to values respecting
+           the bounds) is kept between calls and repaired.
+       'count' only compares, for each of the values, its bounds with the
+           number of variables that must take it (their domain is just
+           that value) and that may take it, in time linear in the size
+           of the domains.
+    '''
+    __slots__ = ('_low', '_up', '_consistency', '_flow')
+    namePrefix = "GCC_"
+    consistencies = ['gac', 'count']
+
+    def __init__(self, name, scope, values, lower_bounds, upper_bounds, consistency='gac'):
+        Constraint.__init__(self,name, scope)
+        if not len(values) == len(lower_bounds) == len(upper_bounds):
+            print("Error GlobalCardinalityConstraint needs one lower and one upper bound per value")
+        self._low = dict(zip(values, lower_bounds))
+        self._up = dict(zip(values, upper_bounds))
+        self._flow = [None] * len(self._scope)    #value each position is assigned in the flow
+        if consistency not in GlobalCardinalityConstraint.consistencies:
+            print("Error GlobalCardinalityConstraint given an illegal consistency {}. Must be one of {}".format(
+                consistency, GlobalCardinalityConstraint.consistencies))
+            consistency = 'gac'
+        self._consistency = consistency
+
+    def lowerBound(self, value):
+        return self._low.get(value, 0)
+
+    def upperBound(self, value):
+        return self._up.get(value, len(self._scope))
+
+    def check(self):
+        counts = dict()
+        for v in self._scope:
+            if not v.isAssigned():
+                return True
+            counts[v.getValue()] = counts.get(v.getValue(), 0) + 1
+        for val in self._low:
+            if not self.lowerBound(val) <= counts.get(val, 0) <= self.upperBound(val):
+                return False
+        return True
+
+    def hasSupport(self, var, val):
+        '''check if var=val has an extension to an assignment of the
+           other variables in the constraint that satisfies the constraint'''
+        if var not in self._scope:
+            return True
+
+        def counts(l):
+            c = dict()
+            for (var, val) in l:
+                c[val] = c.get(val, 0) + 1
+            return c
+
+        def withinUpper(l):
+            self._checks += 1
+            return all([n <= self.upperBound(val) for val, n in counts(l).items()])
+
+        def withinBounds(l):
+            c = counts(l)
+            return all([self.lowerBound(val) <= c.get(val, 0) <= self.upperBound(val) for val in self._low])
+
+        varsToAssign = [v for v in self._scope if v is not var]
+        return findvals(varsToAssign, [(var, val)], withinBounds, withinUpper)
+
+    def reset(self):
+        Constraint.reset(self)
+        self._flow = [None] * len(self._scope)
+
+    def propagate(self, trail):
+        if self._consistency == 'count':
+            return self._count(trail)
+        return self._gac(trail)
+
+    def _count(self, trail):
+        scope = self._scope
+        pruned = []
+        changed = True
+        while changed:
+            changed = False
+            for val in self._low:
+                must = [p for p, v in enumerate(scope) if v.curDomainSize() == 1 and v.inCurDomain(val)]
+                may = [p for p, v in enumerate(scope) if v.curDomainSize() > 1 and v.inCurDomain(val)]
+                self._checks += len(scope)
+                if len(must) > self.upperBound(val) or len(must) + len(may) < self.lowerBound(val):
+                    return "DWO"
+                if not may:
+                    continue
+                if len(must) == self.upperBound(val):
+                    #no other variable can take val
+                    for p in may:
+                        trail.prune(scope[p], scope[p].codeOf(val))
+                elif len(must) + len(may) == self.lowerBound(val):
+                    #every variable that can take val must take it
+                    for p in may:
+                        var = scope[p]
+                        for other in list(var.curDomainView()):
+                            if other != val:
+                                trail.prune(var, var.codeOf(other))
+                else:
+                    continue
+                changed = True
+                for p in may:
+                    if not scope[p] in pruned:
+                        pruned.append(scope[p])
+        return pruned
+
+    def _gac(self, trail):
+        scope = self._scope
+        n = len(scope)
+        domains = [list(v.curDomainView()) for v in scope]
+        self._checks += sum([len(d) for d in domains])
+
+        #repair the flow kept from the last call: unassign the positions
+        #whose value was pruned (or that would exceed an upper bound)
+        flow = self._flow
+        owners = dict()      #value -> positions assigned to it
+        for p in range(n):
+            val = flow[p]
+            if val is not None and scope[p].inCurDomain(val) and \
+               len(owners.get(val, ())) < self.upperBound(val):
+                owners.setdefault(val, []).append(p)
+            else:
+                flow[p] = None
+        #every variable gets a value, within the upper bounds
+        for p in range(n):
+            if flow[p] is None and not self._augment(p, domains, flow, owners):
+                return "DWO"
+        #every value is used at least its lower bound times
+        holders = dict()     #value -> positions that have it in their domain
+        for p in range(n):
+            for val in domains[p]:
+                holders.setdefault(val, []).append(p)
+        for val in self._low:
+            while len(owners.get(val, ())) < self.lowerBound(val):
+                if not self._raise(val, holders, flow, owners):
+                    return "DWO"
+
+        #the residual graph of the flow. Variables are nodes 0..n-1, values
+        #n, n+1, ... and the sink the last node. An edge from a variable to a
+        #value not in the flow is in some feasible flow iff its two ends are
+        #in the same strongly connected component.
+        valueNode = dict()
+        for val in holders:
+            valueNode[val] = n + len(valueNode)
+        sink = n + len(valueNode)
+        graph = [[] for i in range(sink + 1)]
+        for p in range(n):
+            for val in domains[p]:
+                if val == flow[p]:
+                    graph[valueNode[val]].append(p)
+                else:
+                    graph[p].append(valueNode[val])
+        for val, node in valueNode.items():
+            used = len(owners.get(val, ()))
+            if used < self.upperBound(val):
+                graph[node].append(sink)
+            if used > self.lowerBound(val):
+                graph[sink].append(node)
+        component = _stronglyConnectedComponents(graph)
+
+        pruned = []
+        for p, var in enumerate(scope):
+            if var.isAssigned():
+                continue
+            for val in domains[p]:
+                if val != flow[p] and component[p] != component[valueNode[val]]:
+                    trail.prune(var, var.codeOf(val))
+                    if not var in pruned:
+                        pruned.append(var)
+        return pruned
+
+    def _augment(self, p, domains, flow, owners):
+        '''assign the unassigned position p, moving other positions along
+           a shortest augmenting path if needed. Return False if the upper
+           bounds leave no value for p.'''
+        parent = dict()      #value -> (value, position moved to it) it was reached from
+        queue = []
+        for val in domains[p]:
+            if val not in parent:
+                parent[val] = (None, p)
+                queue.append(val)
+        for val in queue:    #queue grows while we iterate over it
+            if len(owners.get(val, ())) < self.upperBound(val):
+                #room at val: shift every position on the path one step
+                while val is not None:
+                    prev, q = parent[val]
+                    if prev is not None:
+                        owners[prev].remove(q)
+                    owners.setdefault(val, []).append(q)
+                    flow[q] = val
+                    val = prev
+                return True
+            for q in owners.get(val, ()):
+                for nxt in domains[q]:
+                    if nxt not in parent:
+                        parent[nxt] = (val, q)
+                        queue.append(nxt)
+        return False
+
+    def _raise(self, val, holders, flow, owners):
+        '''give one more position to val, which is below its lower bound,
+           taking it from a value above its own lower bound (possibly
+           along a chain of moves). Return False if there is none.'''
+        parent = dict()      #value -> (value, position moved from it to that value)
+        parent[val] = None
+        queue = [val]
+        for target in queue:
+            for q in holders.get(target, ()):
+                source = flow[q]
+                if source in parent:
+                    continue
+                parent[source] = (target, q)
+                if len(owners[source]) > self.lowerBound(source):
+                    #move the positions along the chain back to val
+                    while parent[source] is not None:
+                        target, q = parent[source]
+                        owners[source].remove(q)
+                        owners.setdefault(target, []).append(q)
+                        flow[q] = target
+                        source = target
+                    return True
+                queue.append(source)
+        return False
@@ -1,6 +1,7 @@
 import util
 import random
 import sys
+from domains import DOMAIN_TYPES, RangeIndex, intervalRange
 
 class Variable:
     '''Class for defining CSP variables.
@@ -14,18 +15,69 @@ class Variable:
       domain for the variable. Values pruned from the variable domain
       are removed from the current domain but not from the original
       domain. Values can be also restored.
+
+      The values of the domain are interned on construction: each
+      value is given an integer code (its position in the domain) and
+      the current domain is stored as a set of codes. The search and the
+      constraints propagate on the codes (see the *Code methods), and
+      values are only looked up when they are reported. Domain values
+      must therefore be hashable.
+
+      The current domain is kept in a list by default. Passing
+      domainType='bitset' stores it as an integer bitmask and
+      domainType='sparse' as a sparse set instead (see domains.py).
+      Both make inCurDomain, pruneValue and restoreVal O(1) for
+      variables with large domains.
+
+      domainType='interval' is for domains that are a range of integers
+      (e.g., range(10**6)). The domain is kept as a range object, codes
+      are computed from values by subtraction, and the current domain
+      is stored as its bounds plus a set of holes, so the domain is never
+      materialized. curMin and curMax are then O(1), and the search can
+      tighten both bounds with a single trail entry (see
+      backtracking.Trail.pruneBounds). The domain must be a range, or
+      a list of consecutive integers in increasing order.
+
+      The constraints of a CSP register with the variables of their
+      scope (see Constraint.register), and assigning or unassigning a
+      variable updates the count of unassigned variables of each of the
+      constraints registered with it.
     '''
+    __slots__ = ('_name', '_domainType', '_dom', '_codeOf', '_curdom', '_value', '_code',
+                 '_occurrences')
 
-    undoDict = dict()             #stores pruned values indexed by a
-                                        #(variable,value) reason pair
-    def __init__(self, name, domain):
+    def __init__(self, name, domain, domainType='list'):
         '''Create a variable object, specifying its name (a
-        string) and domain of values.
+        string) and domain of values. domainType is one of
+        ['list', 'bitset', 'sparse', 'interval'] and selects how the current
+        domain is stored.
         '''
+        if domainType not in DOMAIN_TYPES:
+            print("Error: unknown domain type {} for variable {}. Must be one of {}".format(
+                domainType, name, list(DOMAIN_TYPES)))
+            domainType = 'list'
         self._name = name                #text name for variable
-        self._dom = list(domain)         #Make a copy of passed domain
-        self._curdom = list(domain)      #using list
+        self._domainType = domainType
+        self._setDomain(domain)
         self._value = None
+        self._code = None                #code of the assigned value
+        self._occurrences = []           #(constraint, position in its scope)
+
+    def _setDomain(self, domain):
+        if self._domainType == 'interval':
+            r = intervalRange(domain)
+            if r is not None:
+                self._dom = r                    #a range is its own (immutable) copy
+                self._codeOf = RangeIndex(r)     #value -> code
+                self._curdom = DOMAIN_TYPES['interval'](len(r))
+                return
+            print("Error: interval domain of variable {} is not an increasing range of integers, using a list".format(self._name))
+            self._domainType = 'list'
+        self._dom = tuple(domain)        #Make a copy of passed domain, code -> value
+        self._codeOf = dict()            #value -> code
+        for code, val in enumerate(self._dom):
+            self._codeOf[val] = code
+        self._curdom = DOMAIN_TYPES[self._domainType](len(self._dom))
 
     def __str__(self):
         return "Variable {}".format(self._name)
@@ -34,28 +86,70 @@ class Variable:
         '''return copy of variable domain'''
         return(list(self._dom))
 
+    def domainView(self):
+        '''return the variable domain as a tuple (a range for interval
+           domains) shared with the variable (no copy is made)'''
+        return self._dom
+
     def domainSize(self):
         '''Return the size of the domain'''
-        return(len(self.domain()))
+        return(len(self._dom))
 
     def resetDomain(self, newdomain):
-        '''reset the domain of this variable'''
-        self._dom = newdomain
+        '''reset the domain of this variable. Constraints built on the
+           old domain (e.g. table constraints) have to be rebuilt.'''
+        self._setDomain(newdomain)
+
+    def codeOf(self, value):
+        '''return the integer code of value (None if value is not in the domain)'''
+        return self._codeOf.get(value)
+
+    def valueOf(self, code):
+        '''return the domain value with integer code code'''
+        return self._dom[code]
 
     def getValue(self):
         return self._value
 
+    def getCode(self):
+        '''return the code of the assigned value (None if unassigned)'''
+        return self._code
+
     def setValue(self, value):
-        if value != None and not value in self._dom:
+        if value == None:
+            self.unAssign()
+            return
+        code = self._codeOf.get(value)
+        if code is None:
             print("Error: tried to assign value {} to variable {} that is not in {}'s domain".format(value,self._name,self._name))
         else:
+            if self._code is None:
+                self._countUnassigned(-1)
             self._value = value
+            self._code = code
+
+    def setCode(self, code):
+        '''assign the value with integer code code'''
+        if self._code is None:
+            self._countUnassigned(-1)
+        self._value = self._dom[code]
+        self._code = code
 
     def unAssign(self):
-        self.setValue(None)
+        if self._code is not None:
+            self._countUnassigned(1)
+        self._value = None
+        self._code = None
+
+    def _countUnassigned(self, delta):
+        '''add delta (1 when the variable is unassigned, -1 when it is
+           assigned) to the unassigned counts of its constraints'''
+        for cnstr, pos in self._occurrences:
+            cnstr._numUnassigned += delta
+            cnstr._unassignedPosSum += delta * pos
 
     def isAssigned(self):
-        return self.getValue() != None
+        return self._code is not None
 
     def name(self):
         return self._name
@@ -65,7 +159,21 @@ class Variable:
            return just its assigned value (this makes implementing hasSupport easier'''
         if self.isAssigned():
             return([self.getValue()])
-        return(list(self._curdom))
+        dom = self._dom
+        return([dom[code] for code in self._curdom])
+
+    def curDomainView(self):
+        '''return a read-only view of the current domain (a CurDomainView,
+           see below) that does not copy it. Like curDomain, it holds just
+           the assigned value if the variable is assigned.'''
+        return CurDomainView(self)
+
+    def curDomainCodes(self):
+        '''return copy of the codes of the current domain (just the code of
+           the assigned value if the variable is assigned)'''
+        if self._code is not None:
+            return [self._code]
+        return list(self._curdom)
 
     def curDomainSize(self):
         '''Return the size of the current domain'''
@@ -73,47 +181,118 @@ class Variable:
             return(1)
         return(len(self._curdom))
 
+    def curMin(self):
+        '''return the smallest value in the current domain (the domain
+           values must be comparable). O(1) for interval domains.'''
+        if self.isAssigned():
+            return self.getValue()
+        if self._domainType == 'interval':
+            return self._dom[self._curdom.lo()]
+        return min(self.curDomainView())
+
+    def curMax(self):
+        '''return the largest value in the current domain (the domain
+           values must be comparable). O(1) for interval domains.'''
+        if self.isAssigned():
+            return self.getValue()
+        if self._domainType == 'interval':
+            return self._dom[self._curdom.hi()]
+        return max(self.curDomainView())
+
     def inCurDomain(self, value):
         '''check if value is in current domain'''
         if self.isAssigned():
             return(value==self.getValue())
-        return(value in self._curdom)
-
-    def pruneValue(self, value, reasonVar, reasonVal):
-        '''Remove value from current domain'''
+        code = self._codeOf.get(value)
+        return(code is not None and code in self._curdom)
+
+    def inCurDomainCode(self, code):
+        '''check if the value with code code is in current domain'''
+        if self._code is not None:
+            return code == self._code
+        return code in self._curdom
+
+    def pruneValue(self, value, reasonVar=None, reasonVal=None):
+        '''Remove value from current domain. The variable does not remember
+           why the value was removed; the search records pruned values on
+           its own trail (see backtracking.Trail) so that they can be
+           restored on backtracking. reasonVar and reasonVal are accepted
+           for backwards compatibility and ignored.'''
+        code = self._codeOf.get(value)
         try:
-            self._curdom.remove(value)
+            self._curdom.remove(code)
         except:
             print("Error: tried to prune value {} from variable {}'s domain, but value not present!".format(value, self._name))
-        dkey = (reasonVar, reasonVal)
-        if not dkey in Variable.undoDict:
-            Variable.undoDict[dkey] = []
-        Variable.undoDict[dkey].append((self, value))
+
+    def pruneCode(self, code):
+        '''Remove the value with code code from current domain'''
+        try:
+            self._curdom.remove(code)
+        except:
+            print("Error: tried to prune value {} from variable {}'s domain, but value not present!".format(self._dom[code], self._name))
 
     def restoreVal(self, value):
-        self._curdom.append(value)
+        self._curdom.append(self._codeOf[value])
+
+    def restoreCode(self, code):
+        self._curdom.append(code)
+
+    undo = restoreCode   #called by the trail (see backtracking.Trail) on backtracking
+
+    def intervalDomain(self):
+        '''return the current domain of an 'interval' variable (None for
+           the other domain types)'''
+        if self._domainType == 'interval':
+            return self._curdom
+        return None
+
+    def sparseDomain(self):
+        '''return the current domain of a 'sparse' variable (None for the
+           other domain types)'''
+        if self._domainType == 'sparse':
+            return self._curdom
+        return None
 
     def restoreCurDomain(self):
-        self._curdom = self.domain()
+        if self._domainType == 'list':
+            self._curdom = DOMAIN_TYPES['list'](len(self._dom))
+        else:
+            self._curdom.restoreAll()
 
     def reset(self):
         self.restoreCurDomain()
         self.unAssign()
 
     def dumpVar(self):
-        print("Variable\"{}={}\": Dom = {}, CurDom = {}".format(self._name, self._value, self._dom, self._curdom))
+        print("Variable\"{}={}\": Dom = {}, CurDom = {}".format(self._name, self._value, list(self._dom), [self._dom[c] for c in self._curdom]))
+
+
+class CurDomainView:
+    '''Read-only view of the current domain of a variable, returned by
+       Variable.curDomainView. It supports len, in and iteration (which
+       can be repeated), and always reflects the current domain of the
+       variable at the time it is used: it holds just the assigned value
+       if the variable is assigned. The domain must not be pruned or
+       restored while the view is being iterated over.'''
+    __slots__ = ('_var',)
+
+    def __init__(self, var):
+        self._var = var
 
-    @staticmethod
-    def clearUndoDict():
-        undoDict = dict()
+    def __len__(self):
+        return self._var.curDomainSize()
 
-    @staticmethod
-    def restoreValues(reasonVar, reasonVal):
-        dkey = (reasonVar, reasonVal)
-        if dkey in Variable.undoDict:
-            for (var,val) in Variable.undoDict[dkey]:
-                var.restoreVal(val)
-            del Variable.undoDict[dkey]
+    def __contains__(self, value):
+        return self._var.inCurDomain(value)
+
+    def __iter__(self):
+        var = self._var
+        if var.isAssigned():
+            return iter((var.getValue(),))
+        return map(var.domainView().__getitem__, var._curdom)
+
+    def __repr__(self):
+        return repr(list(self))
 
 
 #implement various types of constraints
@@ -133,35 +312,159 @@ class Constraint:
        the constraint's scope. IMPORTANT, the scope is ordered! E.g.,
        the constraint greaterThan(V1,V2) is not the same as the
        contraint greaterThan(V2,V1).
+
+       The full name of a constraint is its type's namePrefix followed
+       by the name it was given. It is only built the first time name()
+       is called.
+
+       Constraints may remember the last support found for each value
+       (its residue, see residues()) and re-validate it before searching
+       for a new one. A residue is only used if it is still made of
+       values in the current domains, so it never has to be restored on
+       backtracking. checks() counts the constraint checks made while
+       looking for supports.
+
+       When a constraint is added to a CSP it registers with the
+       variables of its scope, and they keep its count of unassigned
+       variables (and the sum of their positions in the scope) up to date
+       as they are assigned and unassigned. numUnassigned() and
+       lastUnassignedVar() are then O(1); before that (or after
+       unregister()) they scan the scope.
     '''
+    __slots__ = ('_scope', '_rawName', '_name', '_residues', '_checks',
+                 '_numUnassigned', '_unassignedPosSum')
+    namePrefix = "baseClass_"   #override in subconstraint types!
+
     def __init__(self, name, scope):
         '''create a constraint object, specify the constraint name (a
         string) and its scope (an ORDERED list of variable
         objects).'''
-        self._scope = list(scope)
-        self._name = "baseClass_" + name  #override in subconstraint types!
+        self._scope = tuple(scope)
+        self._rawName = name
+        self._name = None
+        self._residues = None   #built on first use
+        self._checks = 0
+        self._numUnassigned = None   #counted by the variables once registered
+        self._unassignedPosSum = 0
 
     def scope(self):
         return list(self._scope)
 
+    def scopeView(self):
+        '''return the scope as a tuple shared with the constraint (no copy
+           is made)'''
+        return self._scope
+
     def arity(self):
         return len(self._scope)
 
 
-    def numUnassigned(self):
-        i = 0
-        for var in self._scope:
+    def register(self):
+        '''ask the variables of the scope to keep the count of unassigned
+           variables of this constraint up to date. Called by the CSP the
+           constraint is added to.'''
+        if self._numUnassigned is not None:
+            return    #already registered
+        self._numUnassigned = 0
+        self._unassignedPosSum = 0
+        for pos, var in enumerate(self._scope):
+            var._occurrences.append((self, pos))
             if not var.isAssigned():
-                i += 1
-        return i
+                self._numUnassigned += 1
+                self._unassignedPosSum += pos
+
+    def unregister(self):
+        '''undo register(), e.g., before dropping a constraint whose
+           variables are still used'''
+        if self._numUnassigned is None:
+            return
+        for var in self._scope:
+            var._occurrences = [occ for occ in var._occurrences if occ[0] is not self]
+        self._numUnassigned = None
+
+    def numUnassigned(self):
+        if self._numUnassigned is None:
+            return len(self.unAssignedVars())
+        return self._numUnassigned
+
+    def lastUnassignedVar(self):
+        '''return the only unassigned variable of the scope (the result
+           is meaningless unless numUnassigned() is 1)'''
+        if self._numUnassigned is None:
+            return self.unAssignedVars()[0]
+        return self._scope[self._unassignedPosSum]
 
     def unAssignedVars(self):
-        return [var for var in self.scope() if not var.isAssigned()]
+        return [var for var in self._scope if not var.isAssigned()]
 
     def check(self):
         util.raiseNotDefined()
 
+    def hasSupport(self, var, val):
+        util.raiseNotDefined()
+
+    def residues(self):
+        '''return the dictionary of residual supports, mapping a value of
+           a variable of the scope (the key is up to the constraint type)
+           to the last support found for it'''
+        if self._residues is None:
+            self._residues = dict()
+        return self._residues
+
+    def checks(self):
+        '''return the number of constraint checks (tests of a tuple or of a
+           pair of values) made since the last resetChecks()'''
+        return self._checks
+
+    def resetChecks(self):
+        self._checks = 0
+
+    def reset(self):
+        '''forget the state kept from a previous search (called by the
+           Solver before it starts a new search)'''
+        self.resetChecks()
+
+    def propagate(self, trail):
+        '''Optional propagator used by GAC instead of calling hasSupport
+           for every value of every variable of the scope. Prune every
+           unsupported value with trail.prune(var, code) and return "DWO"
+           on a domain wipe out, otherwise the list of variables whose
+           domains were pruned. Any other state the propagator keeps
+           between calls must be saved on the trail (trail.save) so that
+           it is restored on backtracking.
+
+           Return None (the default) if the constraint has no propagator.'''
+        return None
+
+    def revise(self, var):
+        '''return the list of the codes of the values in the current domain
+           of var that have no support on this constraint (see hasSupport).
+           GacEnforce and FCCheck call it once per variable, so constraints
+           can override it to find the supports of all the values of var
+           in a single pass. By default, if var is the only unassigned
+           variable of the scope, each value is tried in turn and kept if
+           check() accepts it (so FC only needs check()); otherwise it
+           calls hasSupportCode for each value.'''
+        if self.numUnassigned() == 1 and not var.isAssigned():
+            unsupported = []
+            for code in var.curDomainCodes():
+                var.setCode(code)
+                if not self.check():
+                    unsupported.append(code)
+                var.unAssign()  #NOTE WE MUST UNDO TRIAL ASSIGNMENT
+            return unsupported
+        return [code for code in var.curDomainCodes() if not self.hasSupportCode(var, code)]
+
+    def hasSupportCode(self, var, code):
+        '''hasSupport for the value of var with integer code code. This is
+           what the search calls. Constraints that keep their own data in
+           terms of codes (e.g., tables) override it, the others are
+           answered by hasSupport.'''
+        return self.hasSupport(var, var.valueOf(code))
+
     def name(self):
+        if self._name is None:
+            self._name = self.namePrefix + self._rawName
         return self._name
 
     def __str__(self):
@@ -181,26 +484,41 @@ class CSP:
 
     def __init__(self, name, variables, constraints):
         '''create a CSP problem object passing it a name a list
-           variables objects and a list of constraint objects'''
+           variables objects and a list of constraint objects
+
+           Each variable is given a dense integer id (its position in
+           variables) and the constraints of each variable are computed
+           once here so that looking them up during search is O(1). The
+           neighbouring variables of a variable are only computed when
+           they are first asked for (see neighbours), as they can take
+           O(arity^2) space per constraint.'''
         self._name = name
-        self._variables = variables
-        self._constraints = constraints
+        self._variables = tuple(variables)
+        self._constraints = tuple(constraints)
+        self._varIndex = dict()          #variable -> dense integer id
+        for i, v in enumerate(variables):
+            self._varIndex[v] = i
+        for c in constraints:
+            c.register()                 #see Constraint.numUnassigned
         #some sanity checks
         varsInCnst = set()
         for c in constraints:
-            varsInCnst = varsInCnst.union(c.scope())
+            varsInCnst.update(c.scopeView())
         for v in variables:
             if v not in varsInCnst:
                 print("Warning: variable {} is not in any constraint of the CSP {}".format(v.name(), self.name()))
         for v in varsInCnst:
-            if v not in variables:
+            if v not in self._varIndex:
                 print("Error: variable {} appears in constraint but specified as one of the variables of the CSP {}".format(v.name(), self.name()))
 
-        self.constraints_of = [[] for i in range(len(variables))]
+        constraints_of = [[] for i in range(len(variables))]
         for c in constraints:
-            for v in c.scope():
-                i = variables.index(v)
-                self.constraints_of[i].append(c)
+            for v in c.scopeView():
+                i = self._varIndex.get(v)
+                if i is not None:
+                    constraints_of[i].append(c)
+        self.constraints_of = tuple(tuple(cs) for cs in constraints_of)
+        self._neighbours = [None] * len(variables)   #built on first use
 
     def name(self):
         return self._name
@@ -211,17 +529,47 @@ class CSP:
     def constraints(self):
         return list(self._constraints)
 
+    def variablesView(self):
+        '''return the variables as a tuple shared with the CSP (no copy is made)'''
+        return self._variables
+
+    def constraintsView(self):
+        '''return the constraints as a tuple shared with the CSP (no copy is made)'''
+        return self._constraints
+
+    def varIndex(self, var):
+        '''return the integer id of var in this CSP (None if var is not one
+           of its variables)'''
+        return self._varIndex.get(var)
+
     def constraintsOf(self, var):
         '''return constraints with var in their scope'''
         try:
-            i = self.variables().index(var)
-            return list(self.constraints_of[i])
+            return list(self.constraints_of[self._varIndex[var]])
         except:
             print("Error: tried to find constraint of variable {} that isn't in this CSP {}".format(var, self.name()))
 
+    def adjacentConstraints(self, var):
+        '''return the constraints with var in their scope as a tuple shared
+           with the CSP (no copy is made, so it must not be modified)'''
+        return self.constraints_of[self._varIndex[var]]
+
+    def neighbours(self, var):
+        '''return the variables that share a constraint with var, as a tuple
+           shared with the CSP'''
+        i = self._varIndex[var]
+        if self._neighbours[i] is None:
+            neighbours = dict()   #used as an ordered set
+            for c in self.constraints_of[i]:
+                for w in c.scopeView():
+                    if w is not var:
+                        neighbours[w] = True
+            self._neighbours[i] = tuple(neighbours)
+        return self._neighbours[i]
+
     def unAssignAllVars(self):
         '''unassign all variables'''
-        for v in self.variables():
+        for v in self._variables:
             v.unAssign()
 
     def check(self, solutions):
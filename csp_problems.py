@@ -9,8 +9,10 @@ from itertools import product
 ### NQUEENS
 ##################################################################
 
-def nQueens(n, model):
-    '''Return an n-queens CSP, optionally use tableContraints'''
+def nQueens(n, model, domainType='list'):
+    '''Return an n-queens CSP, optionally use tableContraints. The
+       variables store their current domains as domainType (see
+       csp.Variable).'''
     #your implementation for Question 4 changes this function
     #implement handling of model == 'alldiff'
     if not model in ['table', 'alldiff', 'row']:
@@ -24,15 +26,16 @@ def nQueens(n, model):
 
     vars = []
     for i in dom:
-        vars.append(Variable('Q{}'.format(i), dom))
+        vars.append(Variable('Q{}'.format(i), dom, domainType))
 
     cons = []
 
     if model == 'alldiff':
         for qi in range(len(dom)):
             for qj in range(qi + 1, len(dom)):
-                allDiffConstraint = AllDiffConstraint("C(Q{},Q{})".format(qi + 1,qj + 1), [vars[qi], vars[qj]])
-                neqConstraint = NeqConstraint("C(Q{},Q{})".format(qi + 1,qj + 1), [vars[qi], vars[qj]], qi + 1, qj + 1)
+                name = "C(Q{},Q{})".format(qi + 1,qj + 1)
+                allDiffConstraint = AllDiffConstraint(name, [vars[qi], vars[qj]])
+                neqConstraint = NeqConstraint(name, [vars[qi], vars[qj]], qi + 1, qj + 1)
                 cons.append(allDiffConstraint)
                 cons.append(neqConstraint)
     else:
@@ -235,6 +238,35 @@ def check_resting(problem, schedule):
       return False
   return True
 
+def schedule_csp(schedule_problem):
+    '''Build the CSP solved by solve_schedules: one variable per time slot
+       whose domain is NOCLASS and the classes offered in that slot, and a
+       single table constraint listing every valid schedule.'''
+    # Initialization:
+    k = schedule_problem.num_time_slots
+    scopeList = [['NOCLASS'] for i in range(k)]
+    
+    # Looping through classes:
+    for classItem in schedule_problem.classes:
+        scopeList[int(classItem.split('-')[2]) - 1].append(classItem)
+        
+    # Initializing constraints list and defining variableList:
+    variableList = [Variable(j, scopeList[j]) for j in range(k)]
+    courseList = list(product(*scopeList))
+    courseList = [list(item) for item in courseList]
+    constraints = []
+    
+    # Iterating through course list for potential solutions:
+    for solutionItem in courseList:
+        if check_schedule_solution(schedule_problem, solutionItem):
+            constraints.append(solutionItem)
+    
+    # Defining the table constraint and the CSP:
+    constraints = TableConstraint('all_constraints', variableList, constraints)
+    csp = CSP('Solver', variableList, [constraints])
+    
+    return csp
+
 def solve_schedules(schedule_problem, algo, allsolns,
                  variableHeuristic='mrv', silent=False, trace=False):
     
@@ -273,30 +305,9 @@ def solve_schedules(schedule_problem, algo, allsolns,
        element (a possible schedule) follows the format above.
     '''
     
-    # Initialization:
-    k = schedule_problem.num_time_slots
-    scopeList = [['NOCLASS'] for i in range(k)]
-    
-    # Looping through classes:
-    for classItem in schedule_problem.classes:
-        scopeList[int(classItem.split('-')[2]) - 1].append(classItem)
-        
-    # Initializing constraints list, schedule solution list, and defining variableList:
-    variableList = [Variable(j, scopeList[j]) for j in range(k)]
-    courseList = list(product(*scopeList))
-    courseList = [list(item) for item in courseList]
-    constraints = []
+    csp = schedule_csp(schedule_problem)
     scheduleSolutionList = []
-    
-    # Iterating through course list for potential solutions:
-    for solutionItem in courseList:
-        if check_schedule_solution(schedule_problem, solutionItem):
-            constraints.append(solutionItem)
-    
-    # Defining additional constraints and calling the CSP solver:
-    constraints = TableConstraint('all_constraints', variableList, constraints)
-    csp = CSP('Solver', variableList, [constraints])
-    
+
     # Calling bt_search:
     solutions, num_nodes = bt_search(algo, csp, variableHeuristic, True, trace)
     
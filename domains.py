@@ -0,0 +1,333 @@
+'''Alternative representations for the current domain of a csp.Variable.
+
+   A Variable interns its domain: the value at position i of the domain
+   has the integer code i, and the current domain is the set of codes
+   of the values that have not been pruned. By default the codes are
+   kept in a plain python list. The classes in this module behave like
+   that list (they support len, in, iteration, remove and append) so a
+   Variable can hold one of them instead without any change to the
+   code that calls the Variable methods.
+
+   Each representation is built from the size of the domain, see
+   DOMAIN_TYPES at the end of the module.
+'''
+
+def listDomain(size):
+    '''the default representation, a list of the codes'''
+    return list(range(size))
+
+
+class BitsetDomain:
+    '''Current domain stored as an integer bitmask.
+
+       The code of a value is its bit index. A value is in the current
+       domain if its bit is set, so membership, pruning and restoring
+       take a few integer operations (on ints of size/64 words) instead
+       of a scan of the list.
+
+       This only pays off for large domains: with a few dozen values the
+       list scans are as fast, and e.g. FC and GAC on n-Queens are no
+       faster (see benchmarks.py domains). From about a hundred values
+       on the bitset is much faster, e.g. 0.03s against 0.19s for the
+       list with 1000 values in that benchmark.
+    '''
+    __slots__ = ('_full', '_bits', '_size')
+
+    def __init__(self, size):
+        self._full = (1 << size) - 1
+        self._bits = self._full
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, code):
+        return (self._bits >> code) & 1 == 1
+
+    def __iter__(self):
+        '''iterate over the codes in the current domain (in increasing order)
+           without building a list'''
+        bits = self._bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def remove(self, code):
+        '''remove code from the current domain. Like list.remove, raise
+           ValueError if the code is not present'''
+        bit = 1 << code
+        if not self._bits & bit:
+            raise ValueError("{} not in current domain".format(code))
+        self._bits ^= bit
+        self._size -= 1
+
+    def append(self, code):
+        '''restore a previously removed code'''
+        bit = 1 << code
+        if not self._bits & bit:
+            self._bits |= bit
+            self._size += 1
+
+    def restoreAll(self):
+        '''restore every value of the original domain'''
+        self._bits = self._full
+        self._size = self._full.bit_length()
+
+
+class SparseSetDomain:
+    '''Current domain stored as a sparse set.
+
+       The codes are kept in a dense array together with the position
+       of each code in that array. The first size entries of the array
+       are the current domain, the rest are the pruned codes, most
+       recently pruned first. Pruning swaps the code to the end of the
+       live part and decrements size. Since values are restored in the
+       reverse order of pruning during backtracking, restoring is just
+       incrementing size, and restoring everything pruned below some
+       point is just resetting size (see resize).
+
+       The trail (see backtracking.Trail) relies on the latter: it saves
+       the size of the domain once per search level, at its first
+       pruning in the level, and undoing the level calls resize with it.
+
+       Pruning and restoring leave the dense array permuted, so the
+       current domain is iterated in code order by sorting the live
+       codes (O(size log size)), as the other types iterate it.
+    '''
+    __slots__ = ('_dense', '_pos', '_size', '_token')
+
+    def __init__(self, size):
+        self._dense = list(range(size))
+        self._pos = list(range(size))        #code -> index in _dense
+        self._size = size
+        self._token = None                   #see mark
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, code):
+        return self._pos[code] < self._size
+
+    def __iter__(self):
+        '''iterate over the codes in the current domain in increasing
+           order. Pruning and restoring permute the dense array, so the
+           live codes are sorted (which keeps the order of the values,
+           and so the search, the same as with the other domain types).'''
+        return iter(sorted(self._dense[:self._size]))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _swap(self, i, j):
+        dense = self._dense
+        ci = dense[i]
+        cj = dense[j]
+        dense[i] = cj
+        dense[j] = ci
+        self._pos[cj] = i
+        self._pos[ci] = j
+
+    def remove(self, code):
+        '''remove code from the current domain. Like list.remove, raise
+           ValueError if the code is not present'''
+        i = self._pos[code]
+        if i >= self._size:
+            raise ValueError("{} not in current domain".format(code))
+        self._size -= 1
+        if i != self._size:
+            self._swap(i, self._size)
+
+    def append(self, code):
+        '''restore a previously removed code. O(1), and when codes are
+           restored in the reverse order they were removed no swap is needed'''
+        i = self._pos[code]
+        if i >= self._size:
+            if i != self._size:
+                self._swap(i, self._size)
+            self._size += 1
+
+    def resize(self, size):
+        '''restore all codes removed since the current domain had size
+           codes'''
+        if size > self._size:
+            self._size = size
+
+    undo = resize   #called by the trail with the size it saved
+
+    def mark(self, token):
+        '''return True, and remember token, unless token is the one
+           passed in the previous call. The trail passes a token that
+           identifies the current search level.'''
+        if token is self._token:
+            return False
+        self._token = token
+        return True
+
+    def restoreAll(self):
+        '''restore every value of the original domain'''
+        self._size = len(self._dense)
+
+
+class IntervalDomain:
+    '''Current domain stored as an interval of codes [lo, hi] together with
+       the set of codes inside the interval that have been pruned (the
+       holes). Used for variables whose domain is a range of integers, see
+       intervalRange. The domain is never materialized: size, membership,
+       the bounds, pruning a value and restoring a value are all O(1)
+       (except that when a bound moves past holes they are absorbed, and
+       restoring a value beyond a bound puts them back). keep() moves
+       both bounds at once, in time proportional to the number of holes,
+       and returns a single state for undo() to restore.
+    '''
+    __slots__ = ('_n', '_lo', '_hi', '_holes', '_size')
+
+    def __init__(self, size):
+        self._n = size
+        self.restoreAll()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, code):
+        return self._lo <= code <= self._hi and code not in self._holes
+
+    def __iter__(self):
+        '''iterate over the codes in the current domain (in increasing order)
+           without building a list'''
+        holes = self._holes
+        for code in range(self._lo, self._hi + 1):
+            if code not in holes:
+                yield code
+
+    def __repr__(self):
+        return "[{}..{}] - {}".format(self._lo, self._hi, sorted(self._holes))
+
+    def lo(self):
+        '''smallest code in the current domain (only meaningful if it is not empty)'''
+        return self._lo
+
+    def hi(self):
+        '''largest code in the current domain (only meaningful if it is not empty)'''
+        return self._hi
+
+    def remove(self, code):
+        '''remove code from the current domain. Like list.remove, raise
+           ValueError if the code is not present'''
+        if code not in self:
+            raise ValueError("{} not in current domain".format(code))
+        self._size -= 1
+        holes = self._holes
+        if code == self._lo:
+            lo = code + 1
+            while lo in holes:
+                holes.remove(lo)
+                lo += 1
+            self._lo = lo
+        elif code == self._hi:
+            hi = code - 1
+            while hi in holes:
+                holes.remove(hi)
+                hi -= 1
+            self._hi = hi
+        else:
+            holes.add(code)
+
+    def append(self, code):
+        '''restore a previously removed code'''
+        if code in self:
+            return
+        if self._size == 0:
+            self._lo = self._hi = code
+        elif code < self._lo:
+            self._holes.update(range(code + 1, self._lo))
+            self._lo = code
+        elif code > self._hi:
+            self._holes.update(range(self._hi + 1, code))
+            self._hi = code
+        else:
+            self._holes.discard(code)
+        self._size += 1
+
+    def keep(self, lo, hi):
+        '''remove every code below lo or above hi. Return the state that
+           undo() needs to put them back, or None if nothing was removed.'''
+        lo = max(lo, self._lo)
+        hi = min(hi, self._hi)
+        if self._size == 0 or (lo == self._lo and hi == self._hi):
+            return None
+        saved = (self._lo, self._hi, self._holes, self._size)
+        holes = set([code for code in self._holes if lo <= code <= hi])
+        while lo <= hi and lo in holes:
+            holes.remove(lo)
+            lo += 1
+        while hi >= lo and hi in holes:
+            holes.remove(hi)
+            hi -= 1
+        self._lo = lo
+        self._hi = hi
+        self._holes = holes
+        self._size = max(hi - lo + 1, 0) - len(holes)
+        return saved
+
+    def undo(self, saved):
+        '''restore the state returned by keep()'''
+        self._lo, self._hi, self._holes, self._size = saved
+
+    def restoreAll(self):
+        '''restore every value of the original domain'''
+        self._lo = 0
+        self._hi = self._n - 1
+        self._holes = set()
+        self._size = self._n
+
+
+class RangeIndex:
+    '''Maps the values of a range to their codes (value - start) without
+       building a dict. Supports the dict operations Variable uses.'''
+    __slots__ = ('_range',)
+
+    def __init__(self, r):
+        self._range = r
+
+    def get(self, value, default=None):
+        if isinstance(value, int) and value in self._range:
+            return value - self._range.start
+        return default
+
+    def __getitem__(self, value):
+        code = self.get(value)
+        if code is None:
+            raise KeyError(value)
+        return code
+
+
+def intervalRange(domain):
+    '''return domain as a range with step 1, or None if it is not a
+       contiguous range of integers in increasing order. A range is
+       returned as is; any other iterable has to be materialized to check
+       it. The order of the domain is kept (it gives the codes of the
+       values), so e.g. [3, 1, 2] is not accepted.'''
+    if isinstance(domain, range):
+        if domain.step == 1:
+            return domain
+        if len(domain) <= 1:
+            return range(domain.start, domain.start + len(domain))
+        return None
+    values = list(domain)
+    if not values:
+        return range(0)
+    start = values[0]
+    for i, v in enumerate(values):
+        if not isinstance(v, int) or v != start + i:
+            return None
+    return range(start, start + len(values))
+
+
+#map from the names accepted by Variable(..., domainType=...) to the
+#function used to build the current domain from the size of the domain
+DOMAIN_TYPES = {'list': listDomain, 'bitset': BitsetDomain, 'sparse': SparseSetDomain,
+                'interval': IntervalDomain}
@@ -0,0 +1,198 @@
+'''Regression tests for bugs found in the solver. Run with
+       python3 -m pytest test_regressions.py
+   or
+       python3 test_regressions.py
+'''
+from backtracking import Solver
+import csp_problems
+import pickle
+import random
+import itertools
+from backtracking import GacEnforce
+from constraints import AllDiffConstraint, TableConstraint, NValuesConstraint, \
+    GlobalCardinalityConstraint
+from csp import Constraint, Variable, CSP
+
+def test_mdd_wipeout_stays_dead():
+    '''once the MDD of a table is wiped out at the root, later sweeps
+       must keep reporting the wipe out (not "nothing changed")'''
+    a = Variable('a', [0, 1])
+    b = Variable('b', [0, 1])
+    cons = [TableConstraint('support', [a, b], [[0, 0]], propagator='support'),
+            TableConstraint('mdd', [a, b], [[1, 1]], propagator='mdd')]
+    csp = CSP('mdd-wipeout', [a, b], cons)
+    assert Solver(csp).solve('GAC', True) == []
+
+def test_no_search_after_root_wipeout():
+    '''the search must not start when propagation at the root wipes out
+       a domain'''
+    for consistency in ['gac', 'bounds']:
+        pigeons = [Variable('P{}'.format(i), [0, 1]) for i in range(3)]
+        csp = CSP('3-Pigeons', pigeons, [AllDiffConstraint('holes', pigeons, consistency)])
+        solver = Solver(csp)
+        assert solver.solve('GAC', True) == []
+        assert solver.nodesExplored == 0
+
+class _LessThan(Constraint):
+    '''a constraint that only implements check()'''
+    def check(self):
+        x, y = self._scope
+        return not (x.isAssigned() and y.isAssigned()) or x.getValue() < y.getValue()
+
+def test_fc_with_check_only():
+    '''FC must work on a constraint that implements check() but not
+       hasSupport'''
+    x = Variable('x', [1, 2, 3])
+    y = Variable('y', [1, 2, 3])
+    csp = CSP('less-than', [x, y], [_LessThan('lt', [x, y])])
+    solutions = Solver(csp).solve('FC', True)
+    assert sorted([(s[0][1], s[1][1]) for s in solutions]) == [(1, 2), (1, 3), (2, 3)]
+
+def test_solver_pickles():
+    '''a Solver (without a seed) can be pickled, before and after a search'''
+    solver = Solver(csp_problems.nQueens(6, 'row'), 'random')
+    pickle.loads(pickle.dumps(solver))
+    solver.solve('FC', True)
+    assert len(pickle.loads(pickle.dumps(solver)).solve('GAC', True)) == 4
+
+def test_gac_after_domain_reset():
+    '''propagators that keep state between calls must not reuse it once
+       the domains are reset'''
+    for propagator in ['str2', 'ct', 'mdd']:
+        a = Variable('a', list(range(12)))
+        b = Variable('b', list(range(12)))
+        neq = TableConstraint('neq', [a, b],
+                              [[i, j] for i in range(12) for j in range(12) if i != j],
+                              propagator=propagator)
+        csp = CSP('neq', [a, b], [neq])
+        b.pruneValue(0, None, None)
+        for v in range(2, 12):
+            b.pruneValue(v, None, None)
+        assert GacEnforce([neq], csp, None, None) != "DWO"
+        assert 1 not in a.curDomain()
+        a.reset()
+        b.reset()
+        for v in range(1, 12):
+            b.pruneValue(v, None, None)
+        assert GacEnforce([neq], csp, None, None) != "DWO"
+        assert sorted(a.curDomain()) == list(range(1, 12)), propagator
+
+    v = [Variable('v{}'.format(i), [1, 2]) for i in range(3)]
+    nvalues = NValuesConstraint('nvalues', v, [1], 1, 1)
+    csp = CSP('nvalues', v, [nvalues])
+    v[0].pruneValue(2, None, None)
+    assert GacEnforce([nvalues], csp, None, None) != "DWO"
+    for var in v:
+        var.reset()
+    v[0].pruneValue(1, None, None)
+    assert GacEnforce([nvalues], csp, None, None) != "DWO"
+    assert sorted(v[1].curDomain()) == [1, 2] and sorted(v[2].curDomain()) == [1, 2]
+
+#Brute force comparisons: on small random instances the solutions found
+#by GAC search must be exactly those found by enumerating every
+#assignment, and GAC at the root must prune exactly the values that are
+#in no solution of the constraint (or a subset of them for the weaker
+#consistencies).
+
+def _randomInstance(seed, makeConstraint):
+    '''return the variables, the constraint built by
+       makeConstraint(rng, variables) and its predicate over a tuple of
+       values, for a random instance'''
+    rng = random.Random(seed)
+    variables = [Variable('V{}'.format(i), sorted(rng.sample(range(4), rng.randint(1, 4))))
+                 for i in range(rng.randint(2, 5))]
+    cnstr, pred = makeConstraint(rng, variables)
+    return variables, cnstr, pred
+
+def _enumerate(variables, preds):
+    '''the solutions (tuples of values) of preds found by enumeration'''
+    return set([vals for vals in itertools.product(*[v.domain() for v in variables])
+                if all(pred(vals) for pred in preds)])
+
+def _bruteForce(makeConstraint, exact, instances=60):
+    '''compare search and root propagation with enumeration on random
+       instances. exact is True if the constraint enforces GAC.'''
+    for seed in range(instances):
+        variables, cnstr, pred = _randomInstance(seed, makeConstraint)
+        #search, with a random binary table on the side to mix propagators
+        rng = random.Random(-seed)
+        x, y = rng.sample(range(len(variables)), 2)
+        side = [(a, b) for a in variables[x].domain() for b in variables[y].domain() if rng.random() < 0.7]
+        sideCnstr = TableConstraint('side', [variables[x], variables[y]], side, propagator='support')
+        expected = _enumerate(variables, [pred, lambda vals: (vals[x], vals[y]) in side])
+        solutions = Solver(CSP('brute', variables, [cnstr, sideCnstr])).solve('GAC', True)
+        found = [tuple(val for var, val in s) for s in solutions]
+        assert len(found) == len(set(found)) and set(found) == expected, (seed, cnstr.name())
+
+        #GAC at the root, on the constraint alone
+        variables, cnstr, pred = _randomInstance(seed, makeConstraint)
+        expected = _enumerate(variables, [pred])
+        dwo = GacEnforce([cnstr], CSP('root', variables, [cnstr]), None, None) == "DWO"
+        assert not (dwo and expected), (seed, cnstr.name())
+        assert dwo or expected or not exact, (seed, cnstr.name())
+        for i, var in enumerate(variables):
+            if dwo:
+                break
+            supported = set(vals[i] for vals in expected)
+            assert supported <= set(var.curDomain()), (seed, cnstr.name())
+            if exact:
+                assert supported == set(var.curDomain()), (seed, cnstr.name())
+
+def _table(propagator):
+    def make(rng, variables):
+        tuples = [vals for vals in itertools.product(*[v.domain() for v in variables])
+                  if rng.random() < 0.3]
+        tupleSet = set(tuples)
+        return (TableConstraint('table', variables, tuples, propagator=propagator),
+                lambda vals: vals in tupleSet)
+    return make
+
+def _allDiff(consistency):
+    def make(rng, variables):
+        return (AllDiffConstraint('alldiff', variables, consistency),
+                lambda vals: len(set(vals)) == len(vals))
+    return make
+
+def _nValues(rng, variables):
+    required = rng.sample(range(4), rng.randint(1, 2))
+    lb = rng.randint(0, len(variables))
+    ub = rng.randint(lb, len(variables))
+    return (NValuesConstraint('nvalues', variables, required, lb, ub),
+            lambda vals: lb <= len([v for v in vals if v in required]) <= ub)
+
+def _gcc(consistency):
+    def make(rng, variables):
+        values = rng.sample(range(4), rng.randint(1, 3))
+        low = [rng.randint(0, 2) for v in values]
+        up = [lo + rng.randint(0, 2) for lo in low]
+        return (GlobalCardinalityConstraint('gcc', variables, values, low, up, consistency),
+                lambda vals: all(lo <= vals.count(v) <= u for v, lo, u in zip(values, low, up)))
+    return make
+
+def test_brute_force_tables():
+    '''the table propagators against enumeration'''
+    for propagator in ['support', 'str2', 'ct', 'mdd']:
+        _bruteForce(_table(propagator), True)
+
+def test_brute_force_alldiff():
+    '''the alldiff consistencies against enumeration. Bounds consistency
+       and forward checking do not prune every unsupported value.'''
+    _bruteForce(_allDiff('gac'), True)
+    _bruteForce(_allDiff('bounds'), False)
+    _bruteForce(_allDiff('forward'), False)
+
+def test_brute_force_nvalues():
+    '''NValuesConstraint against enumeration'''
+    _bruteForce(_nValues, True)
+
+def test_brute_force_gcc():
+    '''the global cardinality consistencies against enumeration'''
+    _bruteForce(_gcc('gac'), True)
+    _bruteForce(_gcc('count'), False)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print("{} passed".format(name))